@@ -1,42 +1,62 @@
 import os
-import csv
-from flask import Flask, request, jsonify, send_from_directory, abort
+import sqlite3
+from flask import Flask, request, jsonify, send_from_directory, send_file, abort, g
+
+import images
+import question_bank
 
 # -------------------------------------------------
 # Configuration
 # -------------------------------------------------
 PAPER_NUM = 2
 DATA_DIR  = "dataset"
-DATA_FILE = f"{DATA_DIR}/jeea25_p{PAPER_NUM}.csv"
 IMAGE_DIR = f"{DATA_DIR}/images"
+BANK_FILE = question_bank.BANK_FILE
 PORT       = 5000
+IMAGE_MAX_AGE = 365 * 24 * 3600  # s; content-hashed images are cached for good
 
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
 # -------------------------------------------------
-# Helpers – CSV handling
+# Helpers – question bank
+#
+# Edits go to the question bank (question_bank.py), one row per save, and
+# reach the CSV on export (the Export button, or
+# `python question_bank.py export N`).
 # -------------------------------------------------
 
-def load_dataset():
-    if not os.path.exists(DATA_FILE):
-        raise FileNotFoundError(f"{DATA_FILE} not found – create it or rename your file.")
-    with open(DATA_FILE, newline="", encoding="utf-8") as f:
-        return list(csv.DictReader(f))
-
-def save_dataset(rows):
-    if not rows:
-        return
-    with open(DATA_FILE, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=rows[0].keys())
-        w.writeheader(); w.writerows(rows)
-
-rows = load_dataset()
+def bank():
+    # one connection per request
+    if "bank" not in g:
+        g.bank = question_bank.connect(BANK_FILE)
+    return g.bank
+
+def paper_arg():
+    paper = request.args.get("paper", PAPER_NUM, type=int)
+    if question_bank.paper_info(bank(), paper) is None:
+        if not os.path.exists(question_bank.data_file(paper, DATA_DIR)):
+            abort(404)
+        question_bank.import_csv(bank(), paper, DATA_DIR)
+    return paper
+
+def cached_json(body, etag):
+    # answered with 304 when the client already holds this revision
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 # -------------------------------------------------
 # Flask app
 # -------------------------------------------------
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 
+@app.teardown_appcontext
+def close_bank(_):
+    conn = g.pop("bank", None)
+    if conn is not None:
+        conn.close()
+
 # -------------------------------------------------
 # HTML / JS UI
 # -------------------------------------------------
@@ -111,6 +131,8 @@ INDEX_HTML = r"""<!DOCTYPE html>
 
     <label>Answer <input id='answerInput' style='width:8rem'></label>
     <button id='saveBtn'>Save (Ctrl+S)</button>
+    <button id='exportBtn'>Export CSV</button>
+    <span id='status'></span>
 </header>
 
 <div id='main'>
@@ -137,31 +159,49 @@ INDEX_HTML = r"""<!DOCTYPE html>
 </div>
 
 <script>
-let qData=[],cur=0;
+// Questions are fetched a page at a time as they are opened; the picker
+// only needs the outline. A question is saved when it was edited, with
+// just the changed fields.
+const PAGE=20, FIELDS=['type','text','optA','optB','optC','optD','ans'];
+let outline=[],qData={},pages={},cur=0;
 const $=id=>document.getElementById(id);
 const md=txt=>marked.parse(txt||"");
+const status=msg=>{$('status').textContent=msg||'';};
 
 function typeset(elList){
   if(window.MathJax){ MathJax.typesetPromise(elList).catch(console.error); }
 }
 
-// Load dataset & populate dropdown
-fetch('/questions').then(r=>r.json()).then(d=>{
-  qData=d;
+// Load the outline & populate dropdown
+fetch('/questions/outline').then(r=>r.json()).then(d=>{
+  outline=d.questions;
   const sel=$('qSelect');
-  d.forEach((q,i)=>{
+  outline.forEach((q,i)=>{
     const o=document.createElement('option');
     o.value=i; o.textContent=`#${q.num} – ${q.subject||''}`; sel.appendChild(o);
   });
   open(0);
 });
 
-function open(i){
+function loadPage(p){
+  if(!pages[p]){
+    pages[p]=fetch(`/questions?offset=${p*PAGE}&limit=${PAGE}`).then(r=>r.json()).then(d=>{
+      d.questions.forEach(q=>{ if(!(q.position in qData)) qData[q.position]=q; });
+    });
+  }
+  return pages[p];
+}
+
+async function open(i){
+  await loadPage(Math.floor(i/PAGE));
   cur=i; $('qSelect').value=i;
   const q=qData[i];
   $('typeSelect').value=q.type||'SCA'; $('answerInput').value=q.ans||''; $('questionText').value=q.text||'';
   ['A','B','C','D'].forEach(l=>$("opt"+l).value=q["opt"+l]||'');
-  handleTypeVis(); renderPreview();
+  handleTypeVis(); renderPreview(); status('');
+  $('dropzone').querySelectorAll('img').forEach(img=>img.remove());
+  // the next page is fetched before it is needed
+  if(i%PAGE>=PAGE-3 && i+3<outline.length) loadPage(Math.floor(i/PAGE)+1);
 }
 
 function renderPreview(){
@@ -180,7 +220,7 @@ function handleTypeVis(){
 }
 
 function collect(){
-  const q={...qData[cur]};
+  const q={};
   q.type=$('typeSelect').value.trim();
   q.text=$('questionText').value.trim();
   q.optA=$('optA').value.trim(); q.optB=$('optB').value.trim(); q.optC=$('optC').value.trim(); q.optD=$('optD').value.trim();
@@ -188,16 +228,41 @@ function collect(){
   return q;
 }
 
+function changes(){
+  // fields that differ from the loaded question
+  const q=collect(), saved=qData[cur], diff={};
+  if(!saved) return diff;
+  FIELDS.forEach(f=>{ if(q[f]!==(saved[f]||'')) diff[f]=q[f]; });
+  return diff;
+}
+
 function save(cb){
-  fetch(`/save_question/${cur}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(collect())})
-    .then(r=>{if(!r.ok) alert('Save failed'); else { qData[cur]=collect(); cb&&cb(); }});
+  const diff=changes();
+  if(!Object.keys(diff).length){ cb&&cb(); return; }
+  const i=cur;
+  fetch(`/save_question/${i}`,{method:'POST',headers:{'Content-Type':'application/json'},
+                               body:JSON.stringify({...diff,version:qData[i].version})})
+    .then(r=>r.json().then(j=>[r,j]))
+    .then(([r,j])=>{
+      if(r.ok){ Object.assign(qData[i],diff,{version:j.version}); status('Saved'); cb&&cb(); }
+      else if(r.status===409){
+        qData[i]=j.question;
+        alert('This question was saved by someone else in the meantime; their version is shown now.');
+        open(i);
+      }
+      else alert('Save failed');
+    })
+    .catch(()=>alert('Save failed'));
 }
 $('saveBtn').onclick=()=>save();
+$('exportBtn').onclick=()=>save(()=>{
+  fetch('/export',{method:'POST'}).then(r=>r.json()).then(j=>status(`Exported ${j.exported} question(s) to ${j.file}`));
+});
 document.addEventListener('keydown',e=>{if(e.ctrlKey&&e.key==='s'){e.preventDefault();save();}});
 
 $('qSelect').onchange=()=>{save(()=>open(parseInt($('qSelect').value)));};
 $('prevBtn').onclick=()=>{ if(cur>0) save(()=>open(cur-1)); };
-$('nextBtn').onclick=()=>{ if(cur<qData.length-1) save(()=>open(cur+1)); };
+$('nextBtn').onclick=()=>{ if(cur<outline.length-1) save(()=>open(cur+1)); };
 
 // Drag‑and‑drop images
 const dz=$('dropzone');
@@ -208,10 +273,10 @@ dz.ondrop=e=>{
   [...e.dataTransfer.files].forEach(f=>{
     const fd=new FormData(); 
     fd.append('file',f); 
-    fd.append('qnum',qData[cur].num); 
-    fd.append('subject',qData[cur].subject);
     fetch('/upload_image',{method:'POST',body:fd}).then(r=>r.json()).then(j=>{
       $('questionText').value += `\n\n![](${j.path})\n`; renderPreview();
+      const img=document.createElement('img');
+      img.src=j.thumb; img.style.height='3rem'; img.style.margin='0 .25rem'; dz.appendChild(img);
     });
   });
 };
@@ -228,35 +293,83 @@ def root():
 
 @app.route('/questions')
 def questions():
-    return jsonify(rows)
+    # one page of full questions: ?offset=&limit=
+    paper = paper_arg()
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', question_bank.PAGE_SIZE, type=int), 1), 200)
+    revision = question_bank.revision(bank(), paper)
+    rows = question_bank.page(bank(), paper, offset, limit)
+    body = {"paper": paper, "revision": revision, "offset": offset,
+            "total": question_bank.count(bank(), paper), "questions": [dict(r) for r in rows]}
+    return cached_json(body, f"p{paper}-r{revision}-{offset}-{limit}")
+
+@app.route('/questions/outline')
+def questions_outline():
+    # num, subject and type of every question, for the question picker
+    paper = paper_arg()
+    revision = question_bank.revision(bank(), paper)
+    body = {"paper": paper, "revision": revision,
+            "questions": [dict(r) for r in question_bank.outline(bank(), paper)]}
+    return cached_json(body, f"p{paper}-r{revision}-outline")
 
 @app.route('/save_question/<int:index>', methods=['POST'])
 def save_question(index):
-    if not (0 <= index < len(rows)):
-        abort(404)
-    rows[index] = request.json
-    save_dataset(rows)
-    return ('',204)
+    # body: the changed fields, plus the `version` they were edited from
+    paper = paper_arg()
+    fields = dict(request.json or {})
+    version = fields.pop('version', None)
+    try:
+        new_version = question_bank.update(bank(), paper, index, fields, version)
+    except sqlite3.OperationalError:
+        abort(503)  # the write lock stayed taken
+    if new_version is None:
+        current = question_bank.page(bank(), paper, index, 1)
+        if not current or current[0]['position'] != index:
+            abort(404)
+        # saved by someone else since this copy was loaded
+        return jsonify({"error": "stale", "question": dict(current[0])}), 409
+    return jsonify({"version": new_version})
+
+@app.route('/export', methods=['POST'])
+def export():
+    paper = paper_arg()
+    n = question_bank.export(bank(), paper)
+    return jsonify({"paper": paper, "exported": n, "file": question_bank.paper_info(bank(), paper)['source']})
 
 @app.route('/upload_image', methods=['POST'])
 def upload_image():
+    # stored under the hash of its content; re-uploading an image is a no-op
     if 'file' not in request.files:
         abort(400,'file missing')
     f=request.files['file']
-    qnum=request.form.get('qnum','unk')
-    subject=request.form.get('subject','unknown')
-    ext=os.path.splitext(f.filename)[1] or '.png'
-    name=f"jeea25_p{PAPER_NUM}_{subject}_q{qnum}_{len(os.listdir(IMAGE_DIR))+1}{ext}"
-    dest=os.path.join(IMAGE_DIR,name)
-    f.save(dest)
-    return jsonify({"path":f"/images/{name}"})
+    ext=os.path.splitext(f.filename)[1].lower() or '.png'
+    name,_=images.ingest(f.read(), ext, IMAGE_DIR)
+    return jsonify({"path":f"images/{name}","thumb":f"/images/{name}?variant=thumb"})
 
 @app.route('/images/<path:fn>')
 def serve_img(fn):
-    return send_from_directory(IMAGE_DIR,fn)
+    # ?variant=thumb|optimized once made; the original until then
+    variant=request.args.get('variant')
+    path=images.current_variant(f"images/{fn}", variant) if variant in images.VARIANTS else None
+    immutable=images.HASH_NAME_RGX.match(fn) and (variant is None or path is not None)
+    if path is not None:
+        response=send_file(path, mimetype='image/png', max_age=0)
+    else:
+        response=send_from_directory(IMAGE_DIR, fn, max_age=0)
+    if immutable:
+        # a content-hash name never changes content
+        response.cache_control.no_cache=None
+        response.cache_control.public=True
+        response.cache_control.max_age=IMAGE_MAX_AGE
+        response.cache_control.immutable=True
+    else:
+        response.cache_control.no_cache=True
+    return response
 
 # -------------------------------------------------
 if __name__ == '__main__':
+    # picks up hand edits to the CSV made since the last session
+    question_bank.ensure_paper(question_bank.connect(BANK_FILE), PAPER_NUM, DATA_DIR)
     print(f"⚡ running on http://127.0.0.1:{PORT}")
     app.run(debug=True,port=PORT)
 
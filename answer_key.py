@@ -0,0 +1,152 @@
+import csv
+import functools
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+from pathlib import Path
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+DATA_DIR   = "dataset"
+INDEX_FILE = "cache/answer_keys.pkl"
+
+OPTIONS = 'ABCD'
+OPTION_BITS = {o: 1 << i for i, o in enumerate(OPTIONS)}
+INVALID_OPTION = 1 << len(OPTIONS)  # any token that is not A-D
+
+MAX_SCORES = {
+    'SCA': 3,
+    'MCA': 4,
+    'NT': 4,
+    'M': 4
+}
+
+# -------------------------------------------------
+# Compiled answers
+#
+# A gold answer string is parsed once into:
+#   mask      - bitmask of the correct options (MCA)
+#   intervals - [lo, hi] ranges a numeric answer must fall in (NT); an
+#               exact answer c is the range [c, c], and `a|b` gives one
+#               range per alternative
+# so scoring a prediction is a bitmask or interval check.
+# -------------------------------------------------
+
+Answer = namedtuple('Answer', ['qtype', 'text', 'bonus', 'mask', 'intervals'])
+
+def option_mask(options):
+    mask = 0
+    for option in options:
+        mask |= OPTION_BITS.get(option, INVALID_OPTION)
+    return mask
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+@functools.lru_cache(maxsize=None)
+def parse_answer(qtype, text):
+    bonus = text == 'BONUS'
+    mask = 0
+    intervals = ()
+    if not bonus and qtype == 'MCA':
+        mask = option_mask(text)
+    elif not bonus and qtype == 'NT':
+        ranges = []
+        for cdt in text.split('|'):
+            if cdt[0] == '[':
+                lo, hi = (float(n) for n in cdt[1:-1].split(','))
+            else:
+                lo = hi = float(cdt)
+            ranges.append((lo, hi))
+        intervals = tuple(ranges)
+    return Answer(qtype, text, bonus, mask, intervals)
+
+@functools.lru_cache(maxsize=None)
+def pred_mask(pred):
+    return option_mask(pred.split(','))
+
+def parse_number(pred):
+    try:
+        return float(pred)
+    except (TypeError, ValueError):
+        return None
+
+def score(answer, pred):
+    # JEE(A) marks for one prediction; never raises, whatever pred holds
+    full = MAX_SCORES[answer.qtype]
+    if answer.bonus:
+        return full
+
+    if answer.qtype == 'NT':
+        value = parse_number(pred)
+        if value is not None and any(lo <= value <= hi for lo, hi in answer.intervals):
+            return full
+        return 0
+
+    answered = isinstance(pred, str) and pred != 'O'
+    if answer.qtype == 'MCA':
+        if not answered:
+            return 0
+        mask = pred_mask(pred)
+        common = mask & answer.mask
+        if common == answer.mask:
+            return full
+        if common == mask:
+            return popcount(mask)
+        return -1
+
+    if pred == answer.text:
+        return full
+    if not answered:
+        return 0
+    return -1
+
+# -------------------------------------------------
+# Dataset index
+# -------------------------------------------------
+
+def data_file(paper):
+    return f"{DATA_DIR}/jeea25_p{paper}.csv"
+
+def compile_dataset(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return {
+            (row['subject'], int(row['num'])): parse_answer(row['type'], row['ans'])
+            for row in csv.DictReader(f)
+        }
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_index(paper, index_file=INDEX_FILE):
+    # {(subject, num): Answer} for one paper. Compiled indexes are kept in
+    # index_file and reused until the CSV changes: a matching mtime and size
+    # is trusted, otherwise the content hash decides.
+    csv_path = data_file(paper)
+    stat = os.stat(csv_path)
+
+    cached = {}
+    if os.path.exists(index_file):
+        with open(index_file, 'rb') as f:
+            cached = pickle.load(f)
+
+    entry = cached.get(csv_path)
+    if entry and (entry['mtime'], entry['size']) == (stat.st_mtime, stat.st_size):
+        return entry['index']
+
+    digest = file_hash(csv_path)
+    if entry and entry['sha256'] == digest:
+        index = entry['index']
+    else:
+        index = compile_dataset(csv_path)
+
+    cached[csv_path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest, 'index': index}
+    Path(index_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(cached, f)
+    os.replace(tmp_file, index_file)
+    return index
@@ -0,0 +1,151 @@
+import re
+import sys
+
+# -------------------------------------------------
+# Final answer extraction
+#
+# The prompts ask for `\boxed{ANS}` at the end of the response, with MCA
+# also allowing `final_answer(O)` to skip. A long transcript can box
+# intermediate results on the way, so the answer is the LAST valid marker.
+# Markers are looked for in a window at the end of the text that doubles
+# each time it comes up empty, so the usual case (answer near the end)
+# costs the length of the tail, not the transcript.
+# -------------------------------------------------
+
+MARKERS = ("\\boxed{", "final_answer(")
+CLOSERS = {"\\boxed{": "}", "final_answer(": ")"}
+MAX_ANSWER = 64     # longest answer content looked at, in characters
+TAIL_SIZE  = 256    # characters of streamed text kept while waiting for a marker to close
+SEARCH_WINDOW = 4096  # characters searched for markers first, from the end
+
+OPTION_LETTERS = "ABCD"
+SKIP = "O"  # the answer for a skipped question
+
+# LaTeX that models wrap answers in: \text{A}, \mathrm{B}, $...$, \, etc.
+WRAPPER_RGX = re.compile(r"\\(?:text|textbf|mathrm|mathbf|mbox)\s*\{([^{}]*)\}")
+NOISE_RGX = re.compile(r"\\[,;:! ]|\$|\s|\\?[()]|\{,\}")
+GENERIC_RGX = re.compile(r"^[ABCDO\d,.-]+$")
+# clean() upper-cases, so "A and C" is matched as AANDC
+OPTIONS_RGX = re.compile(r"^[A-D](?:(?:,|AND|\\?&)?[A-D])*$")
+SEPARATOR_RGX = re.compile(r",|AND|\\?&")
+NUMBER_RGX = re.compile(r"^[+-]?(?:\d+\.?\d*|\.\d+)$")
+
+def closing(text, start, closer):
+    # index of the closer matching the marker that ends at `start`, or None;
+    # braces nest, so \boxed{\text{A}} closes on its second }
+    depth = 0
+    for i in range(start, min(len(text), start + MAX_ANSWER)):
+        c = text[i]
+        if c == "{":
+            depth += 1
+        elif c == "}" and depth > 0:
+            depth -= 1
+        elif c == closer and depth == 0:
+            return i
+    return None
+
+def clean(content):
+    previous = None
+    while previous != content:
+        previous, content = content, WRAPPER_RGX.sub(r"\1", content)
+    return NOISE_RGX.sub("", content).upper()
+
+def normalize(content, qtype=None):
+    # The prediction as scored, or None when content is not an answer at all
+    # (`\boxed{x = 3}`). An answer of the wrong form for the question type,
+    # like a number to an SCA question, is returned as written and scores as
+    # a wrong answer.
+    content = clean(content)
+    if qtype == "MCA" and OPTIONS_RGX.match(content):
+        # A,C / AC / (A),(C) / A and C -> A,C
+        return ",".join(sorted(set(SEPARATOR_RGX.sub("", content))))
+    if qtype == "NT" and NUMBER_RGX.match(content.replace(",", "")):
+        # drop a leading + and digit grouping (1{,}250.5); the digits stay as
+        # written, so 2.40 remains 2.40
+        return content.replace(",", "").lstrip("+")
+    if content == SKIP:
+        return SKIP
+    return content if GENERIC_RGX.match(content) else None
+
+def find_last(text, qtype=None, end=None):
+    # (prediction, end index) of the last valid answer before `end`
+    end = len(text) if end is None else end
+    window = SEARCH_WINDOW
+    while end > 0:
+        low = max(0, end - window)
+        starts = [(text.rfind(marker, low, end), marker) for marker in MARKERS]
+        start, marker = max(starts)
+        if start < 0:
+            if low == 0:
+                return None, None
+            # search further back, overlapping by a marker so that one
+            # straddling `low` is found
+            end = low + max(len(m) for m in MARKERS) - 1
+            window *= 2
+            continue
+        content_start = start + len(marker)
+        close = closing(text, content_start, CLOSERS[marker])
+        if close is not None:
+            pred = normalize(text[content_start:close], qtype)
+            if pred is not None:
+                return pred, close + 1
+        end = start
+    return None, None
+
+def extract(text, qtype=None):
+    if not text:
+        return None
+    pred, _ = find_last(text, qtype)
+    return pred
+
+class AnswerScanner:
+    # Follows a streamed response chunk by chunk, holding only a short tail
+    # of the text. `answer` is the last complete answer seen so far; feed()
+    # returns it when the chunk produced a new one.
+    def __init__(self, qtype=None):
+        self.qtype = qtype
+        self.tail = ""
+        self.answer = None
+
+    def feed(self, chunk):
+        self.tail += chunk
+        pred, end = find_last(self.tail, self.qtype)
+        if pred is not None:
+            self.answer = pred
+            self.tail = self.tail[end:]
+        if len(self.tail) > TAIL_SIZE:
+            self.tail = self.tail[-TAIL_SIZE:]
+        return pred
+
+# (text, qtype, prediction) cases that `python answers.py` checks
+EXAMPLES = [
+    ("\\boxed{B}", "SCA", "B"),
+    ("first \\boxed{A}, then \\boxed{C}", "SCA", "C"),
+    ("\\boxed{\\text{D}}", "SCA", "D"),
+    ("\\boxed{A, C}", "MCA", "A,C"),
+    ("\\boxed{CA}", "MCA", "A,C"),
+    ("\\boxed{(A),(C)}", "MCA", "A,C"),
+    ("\\boxed{A and C}", "MCA", "A,C"),
+    ("\\boxed{B \\& D}", "MCA", "B,D"),
+    ("final_answer(O)", "MCA", "O"),
+    ("\\boxed{+1{,}250.5}", "NT", "1250.5"),
+    ("\\boxed{2.40}", "NT", "2.40"),
+    ("\\boxed{x = 3}", "NT", None),
+    ("\\boxed{A}" + "no marker here " * 2000, "SCA", "A"),
+]
+
+def main():
+    failures = 0
+    for text, qtype, expected in EXAMPLES:
+        pred = extract(text, qtype)
+        scanner = AnswerScanner(qtype)
+        for i in range(0, len(text), 7):
+            scanner.feed(text[i:i + 7])
+        if pred != expected or scanner.answer != expected:
+            failures += 1
+            print(f"{text[:40]!r} ({qtype}): expected {expected!r}, got {pred!r} (streamed {scanner.answer!r})")
+    print(f"{len(EXAMPLES) - failures}/{len(EXAMPLES)} examples extracted as expected")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
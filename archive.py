@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+EXT            = ".jra"
+MAGIC          = b"JRA1"
+VERSION        = 1
+COMPRESS_LEVEL = 6
+
+SCALAR_FIELDS = ["num", "subject", "type", "ans", "pred"]
+USAGE_FIELDS  = ["input_tokens", "cached_input_tokens", "output_tokens", "reasoning_tokens", "total_tokens"]
+NO_VALUE      = -1                  # usage count a record does not have
+NO_RESPONSE   = (1 << 64) - 1       # length of a response that is null
+
+# -------------------------------------------------
+# Archive format
+#
+# A result file split into columns, so tools that only need predictions and
+# token counts never touch the response text:
+#
+#   MAGIC, header length (u32 LE), header JSON, data
+#
+# The header maps every column to an (offset, length, kind) block of the
+# data, each compressed on its own with zlib:
+#   json   a JSON list, one value per record (subject, type, ans, pred, and
+#          `extra`: the record's other fields, like timing or samples)
+#   int64  packed integers (num, and usage.<field> with NO_VALUE for a
+#          missing count)
+# Responses are compressed one by one into a blob, with an index of
+# (offset, length) pairs, so one response costs one seek and one
+# decompress. The header also keeps the field order and JSON layout of the
+# source file, so to_json gives the original file back byte for byte.
+#
+# (Parquet with zstd would be the usual choice, but pyarrow and zstandard
+# are not dependencies here; zlib and array are in the stdlib.)
+# -------------------------------------------------
+
+def is_archive(path):
+    return str(path).endswith(EXT)
+
+def pack_ints(values):
+    return zlib.compress(array("q", values).tobytes(), COMPRESS_LEVEL)
+
+def unpack_ints(block):
+    values = array("q")
+    values.frombytes(zlib.decompress(block))
+    return values.tolist()
+
+def pack_json(values):
+    return zlib.compress(json.dumps(values, ensure_ascii=False).encode("utf-8"), COMPRESS_LEVEL)
+
+def unpack_json(block):
+    return json.loads(zlib.decompress(block))
+
+def split_usage(usage):
+    # the usage columns' values, or None when the dict does not fit them
+    if not isinstance(usage, dict) or list(usage) != [f for f in USAGE_FIELDS if f in usage]:
+        return None
+    if not all(isinstance(v, int) and v >= 0 for v in usage.values()):
+        return None
+    return [usage.get(f, NO_VALUE) for f in USAGE_FIELDS]
+
+def write(results, path, json_layout=None):
+    fields = []
+    for record in results:
+        fields += [f for f in record if f not in fields]
+
+    columns = {f: [] for f in SCALAR_FIELDS}
+    usage = {f: [] for f in USAGE_FIELDS}
+    extras = []
+    responses = []
+    for record in results:
+        for f in SCALAR_FIELDS:
+            columns[f].append(record.get(f))
+        counts = split_usage(record["usage"]) if "usage" in record else [NO_VALUE] * len(USAGE_FIELDS)
+        extra = {f: v for f, v in record.items() if f not in SCALAR_FIELDS and f not in ("response", "usage")}
+        if counts is None:
+            extra["usage"] = record["usage"]
+            counts = [NO_VALUE] * len(USAGE_FIELDS)
+        for f, n in zip(USAGE_FIELDS, counts):
+            usage[f].append(n)
+        extras.append(extra or None)
+        responses.append(record.get("response"))
+
+    blocks = {
+        "num": (pack_ints(int(n) for n in columns.pop("num")), "int64"),
+        **{f: (pack_json(values), "json") for f, values in columns.items()},
+        **{f"usage.{f}": (pack_ints(values), "int64") for f, values in usage.items()},
+        "extra": (pack_json(extras), "json"),
+    }
+
+    blob = bytearray()
+    index = array("Q")
+    for response in responses:
+        if response is None:
+            index.extend((len(blob), NO_RESPONSE))
+            continue
+        data = zlib.compress(response.encode("utf-8"), COMPRESS_LEVEL)
+        index.extend((len(blob), len(data)))
+        blob += data
+    blocks["responses.index"] = (zlib.compress(index.tobytes(), COMPRESS_LEVEL), "uint64")
+    blocks["responses"] = (bytes(blob), "blob")
+
+    layout = {}
+    data = bytearray()
+    for name, (block, kind) in blocks.items():
+        layout[name] = [len(data), len(block), kind]
+        data += block
+    header = json.dumps({
+        "version": VERSION,
+        "rows": len(results),
+        "fields": fields,
+        "json": json_layout or {"indent": 2, "ensure_ascii": False, "newline": False},
+        "columns": layout,
+    }).encode("utf-8")
+
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(data)
+    os.replace(tmp_file, path)
+
+class Archive:
+    # Opening reads the header only; columns and responses are read as
+    # they are asked for.
+    def __init__(self, path):
+        self.path = str(path)
+        self.file = open(path, "rb")
+        try:
+            self.header, self.data_start = self.read_header()
+        except Exception:
+            # not an archive, or not one this version reads: no handle kept
+            self.file.close()
+            raise
+        self.cache = {}
+        self.index = None
+
+    def read_header(self):
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not a result archive")
+        (length,) = struct.unpack("<I", self.file.read(4))
+        header = json.loads(self.file.read(length))
+        if header["version"] != VERSION:
+            raise ValueError(f"{self.path}: unsupported archive version {header['version']}")
+        return header, len(MAGIC) + 4 + length
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def block(self, name, start=0, length=None):
+        offset, size, _ = self.header["columns"][name]
+        self.file.seek(self.data_start + offset + start)
+        return self.file.read(size if length is None else length)
+
+    def column(self, name):
+        if name not in self.cache:
+            kind = self.header["columns"][name][2]
+            block = self.block(name)
+            self.cache[name] = unpack_ints(block) if kind == "int64" else unpack_json(block)
+        return self.cache[name]
+
+    def usage(self, row):
+        counts = {f: self.column(f"usage.{f}")[row] for f in USAGE_FIELDS}
+        usage = {f: n for f, n in counts.items() if n != NO_VALUE}
+        return usage or None
+
+    def response(self, row):
+        if self.index is None:
+            self.index = array("Q")
+            self.index.frombytes(zlib.decompress(self.block("responses.index")))
+        offset, length = self.index[2 * row], self.index[2 * row + 1]
+        if length == NO_RESPONSE:
+            return None
+        return zlib.decompress(self.block("responses", offset, length)).decode("utf-8")
+
+    def usage_totals(self):
+        # summed token counts, from the usage columns alone; None for a count
+        # that some record does not have
+        columns = {f: self.column(f"usage.{f}") for f in USAGE_FIELDS}
+        return {f: None if NO_VALUE in values else sum(values) for f, values in columns.items()}
+
+    def records(self, responses=True):
+        # the records in the result file's shape; without responses they
+        # lack the "response" field
+        for row in range(len(self)):
+            values = {f: self.column(f)[row] for f in SCALAR_FIELDS}
+            usage = self.usage(row)
+            if usage is not None:
+                values["usage"] = usage
+            values.update(self.column("extra")[row] or {})
+            if responses:
+                values["response"] = self.response(row)
+            yield {f: values[f] for f in self.header["fields"] if f in values}
+
+# -------------------------------------------------
+# Converters
+# -------------------------------------------------
+
+def json_layout(text):
+    # how the source file was dumped, so it can be dumped the same way
+    return {
+        "indent": 2,
+        "ensure_ascii": text.isascii(),
+        "newline": text.endswith("\n"),
+    }
+
+def from_json(json_path, archive_path=None):
+    archive_path = archive_path or str(Path(json_path).with_suffix(EXT))
+    with open(json_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    write(json.loads(text), archive_path, json_layout(text))
+    return archive_path
+
+def to_json(archive_path, json_path=None):
+    json_path = json_path or str(Path(archive_path).with_suffix(".json"))
+    with Archive(archive_path) as archive:
+        layout = archive.header["json"]
+        results = list(archive.records())
+    tmp_file = f"{json_path}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=layout["indent"], ensure_ascii=layout["ensure_ascii"])
+        if layout["newline"]:
+            f.write("\n")
+    os.replace(tmp_file, json_path)
+    return json_path
+
+def load(path, responses=True):
+    # the records of a result file or archive
+    if is_archive(path):
+        with Archive(path) as archive:
+            return list(archive.records(responses))
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert result files to and from columnar archives")
+    commands = parser.add_subparsers(dest="command", required=True)
+    packer = commands.add_parser("pack", help=f"write a {EXT} archive next to each result file")
+    packer.add_argument("result_files", nargs="+")
+    unpacker = commands.add_parser("unpack", help="write the result file of each archive")
+    unpacker.add_argument("archives", nargs="+")
+    info = commands.add_parser("info", help="list the blocks of each archive")
+    info.add_argument("archives", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        for path in args.result_files:
+            target = from_json(path)
+            print(f"{path} ({os.path.getsize(path)} bytes) -> {target} ({os.path.getsize(target)} bytes)")
+    elif args.command == "unpack":
+        for path in args.archives:
+            print(f"{path} -> {to_json(path)}")
+    elif args.command == "info":
+        for path in args.archives:
+            with Archive(path) as archive:
+                print(f"{path}: {len(archive)} record(s)")
+                for name, (_, size, kind) in archive.header["columns"].items():
+                    print(f"  {name:<32} {kind:<6} {size:>8} bytes")
+
+if __name__ == "__main__":
+    main()
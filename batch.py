@@ -0,0 +1,82 @@
+import json
+import logging
+import time
+
+from openai.types.responses import Response
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+BATCH_ENDPOINT    = "/v1/responses"
+COMPLETION_WINDOW = "24h"
+POLL_INTERVAL     = 60  # seconds
+TERMINAL_STATES   = ("completed", "failed", "expired", "cancelled")
+
+# -------------------------------------------------
+# Batch API helpers
+# -------------------------------------------------
+
+def write_requests(path, requests):
+    # requests is a list of (custom_id, body) pairs, body being the keyword
+    # arguments that would otherwise go to client.responses.create
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }, ensure_ascii=False) + "\n")
+
+def submit(client, path):
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+    )
+    logger.info("Submitted batch %s (%s)", batch.id, path)
+    return batch
+
+def wait(client, batch_id, poll_interval=POLL_INTERVAL):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info("Batch %s is %s: %d/%d done, %d failed", batch_id, batch.status,
+                        counts.completed, counts.total, counts.failed)
+        else:
+            logger.info("Batch %s is %s", batch_id, batch.status)
+        if batch.status in TERMINAL_STATES:
+            return batch
+        time.sleep(poll_interval)
+
+def read_results(client, batch):
+    # Returns ({custom_id: Response}, {custom_id: error}) for a finished batch.
+    responses = {}
+    errors = {}
+
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                # built like the SDK builds its own responses: without strict
+                # validation, so new API fields do not break old runs
+                responses[item["custom_id"]] = Response.construct(**response["body"])
+            else:
+                errors[item["custom_id"]] = item.get("error") or response.get("body")
+
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            errors[item["custom_id"]] = item.get("error") or (item.get("response") or {}).get("body")
+
+    return responses, errors
@@ -0,0 +1,226 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bundle
+import evaluator
+import images
+import journal
+import solver
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+SCALES       = [1, 10, 100]  # copies of the base paper per benchmark
+REPEATS      = 3             # timed passes per benchmark; the best one is kept
+BASE_PAPER   = 1
+RESULT_FILES = "results/final/*.json"
+
+# -------------------------------------------------
+# Synthetic data
+#
+# A scale-n dataset is n copies of the base paper's CSV with the questions
+# renumbered, linking the same images. Result files and model outputs are
+# scaled up from the stored results the same way.
+# -------------------------------------------------
+
+def scaled_dataset(work_dir, scale, paper=BASE_PAPER):
+    data_dir = Path(work_dir) / f"dataset_x{scale}"
+    data_dir.mkdir()
+    os.symlink(Path(solver.IMAGE_DIR).resolve(), data_dir / "images")
+    with open(solver.data_file(paper), newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    with open(data_dir / f"jeea25_p{paper}.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=rows[0].keys())
+        w.writeheader()
+        for copy in range(scale):
+            for row in rows:
+                w.writerow({**row, "num": int(row["num"]) + copy * len(rows)})
+    return data_dir
+
+def stored_results(pattern=RESULT_FILES):
+    results = {}
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            results[path] = json.load(f)
+    return results
+
+def long_outputs(results, scale):
+    # each stored response grown to `scale` times its length with other
+    # responses' reasoning (boxed answers removed), keeping its own ending
+    texts = [r["response"] for rs in results.values() for r in rs if r.get("response")]
+    filler = "\n".join(t.replace("\\boxed", "\\mathbf") for t in texts)
+    outputs = []
+    for text in texts:
+        extra = len(text) * (scale - 1)
+        outputs.append((filler * (extra // len(filler) + 1))[:extra] + text)
+    return outputs
+
+# -------------------------------------------------
+# Benchmarks
+#
+# Each takes (work_dir, scale, data) and returns (items, fn): fn is the
+# timed step, run REPEATS times, over `items` questions or files.
+# -------------------------------------------------
+
+def bench_bundle_build(work_dir, scale, data):
+    data_dir = data["datasets"][scale]
+    bundle_file = Path(work_dir) / f"bundle_x{scale}.pkl"
+    return len(data["bundles"][scale]["papers"][BASE_PAPER]), lambda: bundle.build(str(data_dir), solver.PROMPT_DIR, str(bundle_file))
+
+def bench_bundle_load(work_dir, scale, data):
+    data_dir = data["datasets"][scale]
+    bundle_file = Path(work_dir) / f"bundle_x{scale}.pkl"
+    bundle.build(str(data_dir), solver.PROMPT_DIR, str(bundle_file))
+    return len(data["bundles"][scale]["papers"][BASE_PAPER]), lambda: bundle.load(str(bundle_file), str(data_dir), solver.PROMPT_DIR)
+
+def bench_create_prompt(work_dir, scale, data):
+    questions = data["bundles"][scale]["papers"][BASE_PAPER]
+    def run():
+        for row in questions:
+            for layout in solver.PROMPT_LAYOUTS:
+                solver.create_prompt(row, layout)
+    return len(questions), run
+
+def bench_multimodal_cold(work_dir, scale, data):
+    # a fresh image store for every prompt, so each image is encoded again
+    # (or read from cache/images.bin when images.py has built it)
+    prompts = [q["prompts"]["inline"] for q in data["bundles"][scale]["papers"][BASE_PAPER]]
+    def run():
+        for prompt in prompts:
+            solver.image_store.cache_clear()
+            solver.prompt_to_multimodal_content(prompt)
+    return len(prompts), run
+
+def bench_multimodal_warm(work_dir, scale, data):
+    # through solver.prompt_to_multimodal_content with the shared image store
+    prompts = [q["prompts"]["inline"] for q in data["bundles"][scale]["papers"][BASE_PAPER]]
+    def run():
+        for prompt in prompts:
+            solver.prompt_to_multimodal_content(prompt)
+    return len(prompts), run
+
+def bench_extract_answer(work_dir, scale, data):
+    outputs = long_outputs(data["results"], scale)
+    def run():
+        for text in outputs:
+            solver.extract_final_answer(text)
+    return len(outputs), run
+
+def bench_journal_write(work_dir, scale, data):
+    base = data["base_results"]
+    records = [{"paper": BASE_PAPER, "model": "bench", **r, "num": r["num"] + copy * len(base)}
+               for copy in range(scale) for r in base]
+    path = Path(work_dir) / f"journal_x{scale}.jsonl"
+    def run():
+        if path.exists():
+            path.unlink()
+        for record in records:
+            journal.append(str(path), record)
+    return len(records), run
+
+def bench_journal_compact(work_dir, scale, data):
+    base = data["base_results"]
+    path = Path(work_dir) / f"compact_x{scale}.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for copy in range(scale):
+            for r in base:
+                f.write(json.dumps({"paper": BASE_PAPER, "model": "bench", **r,
+                                    "num": r["num"] + copy * len(base)}, ensure_ascii=False) + "\n")
+    output_file = Path(work_dir) / f"compact_x{scale}.json"
+    return len(base) * scale, lambda: journal.compact(str(path), str(output_file))
+
+def bench_evaluator(work_dir, scale, data):
+    # scale copies of every stored result file, loaded and scored together
+    result_dir = Path(work_dir) / f"results_x{scale}"
+    result_dir.mkdir()
+    paths = []
+    for copy in range(scale):
+        for path, results in data["results"].items():
+            stem = Path(path).stem
+            target = result_dir / f"{stem}-{copy + 1}.json"
+            with open(target, "w", encoding="utf-8") as f:
+                json.dump(results, f)
+            paths.append(str(target))
+    return len(paths), lambda: evaluator.score_table(evaluator.load_results(paths))
+
+BENCHMARKS = {
+    "bundle_build": bench_bundle_build,
+    "bundle_load": bench_bundle_load,
+    "create_prompt": bench_create_prompt,
+    "multimodal_content_cold": bench_multimodal_cold,
+    "multimodal_content_warm": bench_multimodal_warm,
+    "extract_final_answer": bench_extract_answer,
+    "journal_append": bench_journal_write,
+    "journal_compact": bench_journal_compact,
+    "evaluator_score": bench_evaluator,
+}
+
+def time_it(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the per-question and per-run steps of the pipeline")
+    parser.add_argument("--scales", nargs="+", type=int, default=SCALES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "image_store": os.path.exists(images.STORE_FILE),
+        "benchmarks": [],
+    }
+
+    with tempfile.TemporaryDirectory(prefix="jeebench_") as work_dir:
+        results = stored_results()
+        data = {
+            "results": results,
+            "base_results": next(rs for path, rs in results.items() if f"_p{BASE_PAPER}_" in path),
+            "datasets": {s: scaled_dataset(work_dir, s) for s in args.scales},
+        }
+        data["bundles"] = {
+            s: bundle.build(str(data["datasets"][s]), solver.PROMPT_DIR, str(Path(work_dir) / f"prep_x{s}.pkl"))
+            for s in args.scales
+        }
+
+        for name in args.only or BENCHMARKS:
+            for scale in args.scales:
+                items, fn = BENCHMARKS[name](work_dir, scale, data)
+                times = time_it(fn, args.repeats)
+                best = min(times)
+                report["benchmarks"].append({
+                    "name": name,
+                    "scale": scale,
+                    "items": items,
+                    "best_s": round(best, 6),
+                    "median_s": round(statistics.median(times), 6),
+                    "per_item_us": round(best / items * 1e6, 3) if items else None,
+                })
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
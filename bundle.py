@@ -0,0 +1,151 @@
+import argparse
+import csv
+import hashlib
+import logging
+import os
+import pickle
+import re
+from pathlib import Path
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+DATA_DIR    = "dataset"
+PROMPT_DIR  = "prompts"
+BUNDLE_FILE = "cache/bundle.pkl"
+VERSION     = 1
+
+LAYOUTS = ["inline", "prefix"]
+QUESTION_SECTIONS = {
+    "SCA": "Single correct answer (SCA)",
+    "MCA": "One or more correct answers (MCA)",
+    "NT": "Numerical answer (NT)",
+    "M": "Matching (M)",
+}
+
+PAPER_RGX = re.compile(r"^jeea25_p(\d+)\.csv$")
+IMAGE_RGX = re.compile(r'!\[.*?\]\((.*?)\)')
+
+# -------------------------------------------------
+# Bundle
+#
+# Every question of every paper, rendered once in every prompt layout:
+#   {"version", "sources": {path: (mtime_ns, size)},
+#    "system_prompt", "prefix_prompt",
+#    "papers": {paper: [question, ...]}}
+# where a question is a dict with the CSV's num, subject, type, ans and text,
+# "prompts" ({layout: prompt}), "images" (the image paths its prompts link
+# to) and "hash" (sha256 of its prompts and answer). Jinja and the CSVs are
+# only read when the bundle is (re)built.
+# -------------------------------------------------
+
+def source_files(data_dir=DATA_DIR, prompt_dir=PROMPT_DIR):
+    csvs = [p for p in Path(data_dir).iterdir() if PAPER_RGX.match(p.name)]
+    return sorted(str(p) for p in csvs + list(Path(prompt_dir).iterdir()) if p.is_file())
+
+def signature(paths):
+    sources = {}
+    for path in paths:
+        stat = os.stat(path)
+        sources[path] = (stat.st_mtime_ns, stat.st_size)
+    return sources
+
+def question_hash(question):
+    h = hashlib.sha256()
+    for layout in LAYOUTS:
+        h.update(question["prompts"][layout].encode("utf-8") + b"\0")
+    h.update(question["ans"].encode("utf-8"))
+    return h.hexdigest()
+
+def build(data_dir=DATA_DIR, prompt_dir=PROMPT_DIR, bundle_file=BUNDLE_FILE):
+    from jinja2 import Environment, FileSystemLoader
+
+    env = Environment(loader=FileSystemLoader(prompt_dir))
+    with open(f"{prompt_dir}/system.txt", "r") as f:
+        system_prompt = f.read().strip()
+    templates = {qtype: env.get_template(f"{qtype.lower()}.j2") for qtype in QUESTION_SECTIONS}
+    prefix_question_template = env.get_template("prefix_question.j2")
+
+    sources = source_files(data_dir, prompt_dir)
+    papers = {}
+    for path in sources:
+        match = PAPER_RGX.match(Path(path).name)
+        if match is None:
+            continue
+        questions = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                qtype = row["type"]
+                context = {"question": row["text"]}
+                if qtype != "NT":
+                    context["options"] = [row["optA"], row["optB"], row["optC"], row["optD"]]
+                prompts = {
+                    "inline": templates[qtype].render(context),
+                    "prefix": prefix_question_template.render(
+                        context, section=QUESTION_SECTIONS[qtype],
+                        question_template=f"{qtype.lower()}_question.j2"),
+                }
+                images = IMAGE_RGX.findall(prompts["inline"])
+                missing = [p for p in images if not (Path(data_dir) / p).is_file()]
+                if missing:
+                    raise FileNotFoundError(
+                        f"{path}: {row['subject']} Q{row['num']} links missing image(s) {missing}")
+                question = {
+                    "num": int(row["num"]),
+                    "subject": row["subject"],
+                    "type": qtype,
+                    "ans": row["ans"],
+                    "text": row["text"],
+                    "prompts": prompts,
+                    "images": images,
+                }
+                question["hash"] = question_hash(question)
+                questions.append(question)
+        papers[int(match.group(1))] = questions
+
+    data = {
+        "version": VERSION,
+        "sources": signature(sources),
+        "system_prompt": system_prompt,
+        "prefix_prompt": env.get_template("prefix.j2").render(system_prompt=system_prompt),
+        "papers": papers,
+    }
+    Path(bundle_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = f"{bundle_file}.tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, bundle_file)
+    return data
+
+def is_current(data, data_dir=DATA_DIR, prompt_dir=PROMPT_DIR):
+    # stat() of the sources only; nothing is re-read or re-rendered
+    if data.get("version") != VERSION:
+        return False
+    try:
+        return data["sources"] == signature(source_files(data_dir, prompt_dir))
+    except OSError:
+        return False
+
+def load(bundle_file=BUNDLE_FILE, data_dir=DATA_DIR, prompt_dir=PROMPT_DIR):
+    # the bundle, rebuilt first if a CSV or template changed since its build
+    if os.path.exists(bundle_file):
+        with open(bundle_file, "rb") as f:
+            data = pickle.load(f)
+        if is_current(data, data_dir, prompt_dir):
+            return data
+        logger.info("Dataset or prompts changed since %s was built, rebuilding", bundle_file)
+    return build(data_dir, prompt_dir, bundle_file)
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render every question into one bundle for the solver")
+    parser.add_argument("--output", default=BUNDLE_FILE)
+    args = parser.parse_args()
+
+    data = build(bundle_file=args.output)
+    for paper, questions in sorted(data["papers"].items()):
+        images = sum(len(q["images"]) for q in questions)
+        print(f"Paper {paper}: {len(questions)} question(s), {images} image link(s)")
+    print(f"Wrote {args.output} ({os.path.getsize(args.output)} bytes)")
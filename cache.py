@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from openai.types.responses import Response
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+CACHE_DIR    = "cache/responses"
+MAX_SIZE_MB  = 512
+MAX_AGE_DAYS = 90
+
+# -------------------------------------------------
+# Response cache
+#
+# Responses are stored under a hash of exactly what is sent to the API: the
+# model, the developer prompt (if the model gets one), the rendered question
+# text and the image bytes. Fixing an answer key or a template that renders
+# to the same text therefore re-uses the old response instead of paying for
+# it again.
+# -------------------------------------------------
+
+def request_key(model, input, sample=0):
+    # repeated samples of one request are cached separately; the first keeps
+    # the plain key so it matches responses cached before sampling existed
+    request = {"model": model, "input": input}
+    if sample:
+        request["sample"] = sample
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / key[:2] / f"{key}.json"
+
+def get(key, cache_dir=CACHE_DIR, max_age_days=MAX_AGE_DAYS):
+    path = cache_path(key, cache_dir)
+    try:
+        stat = path.stat()
+        if time.time() - stat.st_mtime > max_age_days * 86400:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            response = Response.construct(**json.load(f))
+    except (OSError, json.JSONDecodeError):
+        return None
+    # An entry's mtime is when it was written and limits its age; its atime
+    # is when it was last used and orders eviction. Only the atime is
+    # touched, so an entry that is hit often still expires.
+    os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    return response
+
+def put(key, response, cache_dir=CACHE_DIR):
+    path = cache_path(key, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(response.to_json(indent=None))
+    os.replace(tmp_path, path)
+
+def evict(cache_dir=CACHE_DIR, max_size_mb=MAX_SIZE_MB, max_age_days=MAX_AGE_DAYS):
+    # Drops entries written more than max_age_days ago, then the least
+    # recently used ones until the cache fits in max_size_mb.
+    now = time.time()
+    entries = []
+    for path in Path(cache_dir).glob("*/*.json"):
+        stat = path.stat()
+        if now - stat.st_mtime > max_age_days * 86400:
+            path.unlink()
+        else:
+            entries.append((stat.st_atime, stat.st_size, path))
+
+    size = sum(e[1] for e in entries)
+    removed = 0
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size_mb * 1024 * 1024:
+            break
+        path.unlink()
+        size -= entry_size
+        removed += 1
+
+    if removed:
+        logger.info("Evicted %d cached response(s)", removed)
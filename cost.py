@@ -1,55 +1,70 @@
-import json
+import os
 import re
 import sys
+from pathlib import Path
 
-RESULT_FILE = sys.argv[1]
-
-def main():
-
-    cost_per_input_token = {
-        'o4-mini': 1.1 / 1e6,
-        'gpt-4o': 2.5 / 1e6,
-        'o3': 10 / 1e6,
-    }
+import archive
+import ledger
+import pricing
 
-    cost_per_output_token = {k: v*4 for k,v in cost_per_input_token.items()}
-
-    model_name = None
-    for cdt_model_name in cost_per_input_token:
-        if cdt_model_name in RESULT_FILE:
-            model_name = cdt_model_name
+RESULT_FILE = sys.argv[1]
 
-    if model_name is None:
-        raise RuntimeError("File name should have model name in it")
+def file_usage(path):
+    # summed token counts of a result file; archives from their usage columns alone
+    if archive.is_archive(path):
+        with archive.Archive(path) as result_archive:
+            return result_archive.usage_totals()
+    results = archive.load(path, responses=False)
+    if not all(record.get('usage') for record in results):
+        return dict.fromkeys(archive.USAGE_FIELDS)
+    return {field: sum(record['usage'].get(field, 0) for record in results) for field in archive.USAGE_FIELDS}
 
-    total_cost = 0
-    total_input_tokens = 0
-    total_output_tokens = 0
-    total_input_token_cost = 0
-    total_output_token_cost = 0
+def main():
 
-    with open(RESULT_FILE, 'r') as result_file:
-        results_json = json.load(result_file)
-        for question in results_json:
-            usage = question['usage']
-            num_input_tokens = usage['input_tokens']
-            num_output_tokens = usage['output_tokens']
-            total_input_tokens += num_input_tokens
-            total_output_tokens += num_output_tokens
+    # RESULT_FILE is a result file, an archive or the name of a run in the
+    # ledger. Files are costed from the file itself and left out of the
+    # ledger; `python ledger.py import` adds them. A file's Batch API
+    # discount comes from the ledger when the run is in it, else from the
+    # run's kept batch request file.
+    name = Path(RESULT_FILE).stem
+    if Path(RESULT_FILE).exists():
+        match = ledger.RUN_RGX.match(name)
+        if match is None:
+            raise ValueError(f"Not a run name: {name}")
+        known = ledger.run_info(ledger.connect(), name) if os.path.exists(ledger.LEDGER_FILE) else None
+        batch = known["batch"] if known is not None else int(ledger.batch_run(name, RESULT_FILE))
+        run = {"model": match.group(2), "batch": batch, "started": ledger.parse_run_time(match.group(3))}
+        usage = file_usage(RESULT_FILE)
+        cost = pricing.priced_usage(usage, run)
+    else:
+        conn = ledger.connect()
+        run = ledger.run_info(conn, name)
+        if run is None:
+            raise RuntimeError(f"{RESULT_FILE} is neither a result file nor a run in the ledger")
+        usage = ledger.run_usage(conn, name)
+        cost = pricing.run_cost(conn, name)
 
-    total_input_token_cost = total_input_tokens * cost_per_input_token[model_name]
-    total_output_token_cost = total_output_tokens * cost_per_output_token[model_name]
+    if usage['input_tokens'] is None:
+        raise RuntimeError(f"{name} has answers without usage records, so its cost is unknown")
 
-    total_cost = total_input_token_cost + total_output_token_cost
+    total_input_tokens = usage['input_tokens']
+    total_cached_input_tokens = usage['cached_input_tokens']
+    total_output_tokens = usage['output_tokens']
+    total_reasoning_tokens = usage['reasoning_tokens']
+    total_cost = cost['total_cost']
 
     total_tokens = total_input_tokens + total_output_tokens
     print(f"Total tokens: {total_tokens}")
     print(f"   input: {total_input_tokens} ({total_input_tokens * 100 / total_tokens:.2f}%)")
+    print(f"     cached: {total_cached_input_tokens}")
     print(f"  output: {total_output_tokens} ({total_output_tokens * 100 / total_tokens:.2f}%)")
+    print(f"     reasoning: {total_reasoning_tokens}")
 
-    print(f"Total cost: ${total_cost:.6f}")
-    print(f"   input: ${total_input_token_cost:.6f} ({total_input_token_cost * 100 / total_cost:.2f}%)")
-    print(f"  output: ${total_output_token_cost:.6f} ({total_output_token_cost * 100 / total_cost:.2f}%)")
+    batch = " (batch)" if run['batch'] else ""
+    print(f"Total cost: ${total_cost:.6f} at {cost['price_version']} prices{batch}")
+    for field in pricing.COST_FIELDS:
+        label = field[:-len("_cost")].replace("_", " ")
+        print(f"  {label}: ${cost[field]:.6f} ({cost[field] * 100 / total_cost:.2f}%)")
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,28 @@
-import sys
-from datetime import datetime
+import argparse
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import ledger
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+BUCKET_SECONDS = 60    # width of a throughput bucket
+MAX_LATENCY    = 3600  # s; longer latencies share the histogram's last bin
+TAIL_BLOCK     = 64 * 1024
+
+# lines as written by solver.setup_logger; messages can span several lines,
+# and only their first line starts with a timestamp
+LINE_RGX = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] (\w+) : (.*)")
+CALL_RGX = re.compile(r"^Calling OpenAI model (\S+)(?: for question (\d+) of (\S+))?")
+ANSWER_RGX = re.compile(r"^Got final answer (.*) for question (\d+)(?: of (\S+))?")
+RETRY_RGX = re.compile(r"^Retrying (\S+) in ([\d.]+)s")
+CACHED_PREFIX = "Using cached response"
 
 def extract_timestamp(line):
     try:
@@ -8,19 +31,286 @@ def extract_timestamp(line):
     except Exception as e:
         raise ValueError(f"Invalid log format in line: {line}\nError: {e}")
 
-def compute_log_duration(filepath):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+# -------------------------------------------------
+# Duration
+#
+# The first timestamp is read from the head of the log and the last one
+# by seeking back from its end, so a multi-GB log costs two small reads.
+# -------------------------------------------------
 
-    if len(lines) < 2:
+def first_timestamp(f):
+    f.seek(0)
+    for line in f:
+        if LINE_RGX.match(line.decode("utf-8", "replace")):
+            return extract_timestamp(line.decode("utf-8", "replace"))
+    return None
+
+def last_timestamp(f):
+    end = f.seek(0, os.SEEK_END)
+    tail = b""
+    while end > 0:
+        start = max(0, end - TAIL_BLOCK)
+        f.seek(start)
+        tail = f.read(end - start) + tail
+        end = start
+        # the first line of the block may be cut, unless the block starts the file
+        lines = tail.split(b"\n")
+        for line in reversed(lines if start == 0 else lines[1:]):
+            text = line.decode("utf-8", "replace")
+            if LINE_RGX.match(text):
+                return extract_timestamp(text)
+        tail = lines[0]
+    return None
+
+def compute_log_duration(filepath):
+    with open(filepath, 'rb') as f:
+        start_time = first_timestamp(f)
+        end_time = last_timestamp(f)
+    if start_time is None:
         raise ValueError("Log file must contain at least two lines")
+    return end_time - start_time
 
-    start_time = extract_timestamp(lines[0])
-    end_time = extract_timestamp(lines[-1])
+def run_duration(name):
+    # from the run ledger when it has the run's timings, else from its log
+    duration = ledger.run_duration(ledger.connect(), name)
+    if duration is not None:
+        return timedelta(seconds=round(duration))
+    return compute_log_duration(f"{ledger.LOG_DIR}/{name}.log")
 
-    duration = end_time - start_time
-    return duration
+# -------------------------------------------------
+# Analysis
+#
+# One pass over a log pairs every "Calling OpenAI model" line with the
+# "Got final answer" line of the same question. Solver logs name the
+# question and run on both lines; in older logs, where the solver asked one
+# question at a time, a call pairs with the next answer. From the pairs:
+#   latency     first call to answer, per question (the log has 1s
+#               resolution); kept as a histogram of 1s bins
+#   idle        time with no request in flight: before the first call and
+#               between an answer and the next call
+#   retry sleep backoff announced by the scheduler's "Retrying" lines
+#   throughput  answers per BUCKET_SECONDS
+# Memory grows with the requests in flight and the run's length in
+# buckets, not with the size of the log. Question rows can be streamed
+# out as they pair (--questions).
+# -------------------------------------------------
 
-if __name__ == '__main__':
+def new_summary(path):
+    return {
+        "file": str(path), "start": None, "end": None,
+        "calls": 0, "answers": 0, "paired": 0, "cached": 0, "unanswered": 0,
+        "latency_sum": 0, "latency_max": 0, "latency_hist": [0] * (MAX_LATENCY + 1),
+        "log_time": 0, "idle": 0, "retries": 0, "retry_sleep": 0.0,
+        "models": {}, "throughput": {},
+    }
+
+def analyze(path, bucket_seconds=BUCKET_SECONDS, questions_file=None):
+    summary = new_summary(path)
+    keyed = {}       # (run, question) -> (first call time, model)
+    fifo = deque()   # (call time, model) of calls that do not name a question
+    cached = 0       # cache hits whose (unnamed) answer is still to come
+    idle_since = None
+    last_stamp = now = None
+    out = open(questions_file, "w", encoding="utf-8") if questions_file else None
+    if out:
+        out.write("run,question,model,called,answered,latency\n")
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = LINE_RGX.match(line)
+            if match is None:
+                continue
+            stamp, _, message = match.groups()
+            # many lines share a second, so a timestamp is parsed once
+            if stamp != last_stamp:
+                last_stamp = stamp
+                now = datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").timestamp()
+            if summary["start"] is None:
+                summary["start"] = idle_since = now
+            summary["end"] = now
+
+            call = CALL_RGX.match(message)
+            if call:
+                summary["calls"] += 1
+                if idle_since is not None:
+                    summary["idle"] += now - idle_since
+                    idle_since = None
+                model, question, run = call.groups()
+                if question is None:
+                    fifo.append((now, model))
+                else:
+                    keyed.setdefault((run, int(question)), (now, model))
+                continue
+
+            answer = ANSWER_RGX.match(message)
+            if answer:
+                summary["answers"] += 1
+                bucket = int(now // bucket_seconds * bucket_seconds)
+                summary["throughput"][bucket] = summary["throughput"].get(bucket, 0) + 1
+                _, question, run = answer.groups()
+                if run is not None:
+                    paired = keyed.pop((run, int(question)), None)
+                elif cached:
+                    cached -= 1
+                    paired = None
+                else:
+                    paired = fifo.popleft() if fifo else None
+
+                if paired is None:
+                    summary["cached"] += 1
+                else:
+                    called, model = paired
+                    latency = int(now - called)
+                    summary["paired"] += 1
+                    summary["latency_sum"] += latency
+                    summary["latency_max"] = max(summary["latency_max"], latency)
+                    summary["latency_hist"][min(latency, MAX_LATENCY)] += 1
+                    stats = summary["models"].setdefault(model, {"paired": 0, "latency_sum": 0})
+                    stats["paired"] += 1
+                    stats["latency_sum"] += latency
+                    if out:
+                        out.write(f"{run or ''},{question},{model},{called:.0f},{now:.0f},{latency}\n")
+                if not keyed and not fifo:
+                    idle_since = now
+                continue
+
+            retry = RETRY_RGX.match(message)
+            if retry:
+                summary["retries"] += 1
+                summary["retry_sleep"] += float(retry.group(2))
+            elif message.startswith(CACHED_PREFIX):
+                cached += 1
 
-    print(compute_log_duration(sys.argv[1]))
+    if out:
+        out.close()
+    summary["unanswered"] = len(keyed) + len(fifo)
+    if summary["start"] is not None:
+        summary["log_time"] = summary["end"] - summary["start"]
+    return summary
+
+def merge(summaries):
+    total = new_summary("total")
+    starts = [s["start"] for s in summaries if s["start"] is not None]
+    ends = [s["end"] for s in summaries if s["end"] is not None]
+    total["start"], total["end"] = (min(starts), max(ends)) if starts else (None, None)
+    for s in summaries:
+        for field in ("calls", "answers", "paired", "cached", "unanswered", "latency_sum",
+                      "log_time", "idle", "retries", "retry_sleep"):
+            total[field] += s[field]
+        total["latency_max"] = max(total["latency_max"], s["latency_max"])
+        total["latency_hist"] = [a + b for a, b in zip(total["latency_hist"], s["latency_hist"])]
+        for model, stats in s["models"].items():
+            merged = total["models"].setdefault(model, {"paired": 0, "latency_sum": 0})
+            merged["paired"] += stats["paired"]
+            merged["latency_sum"] += stats["latency_sum"]
+        for bucket, n in s["throughput"].items():
+            total["throughput"][bucket] = total["throughput"].get(bucket, 0) + n
+    return total
+
+def percentile(hist, q):
+    n = sum(hist)
+    if n == 0:
+        return None
+    rank = q * (n - 1)
+    seen = 0
+    for latency, count in enumerate(hist):
+        seen += count
+        if seen > rank:
+            return latency
+    return len(hist) - 1
+
+# -------------------------------------------------
+# Report
+# -------------------------------------------------
+
+def format_seconds(seconds):
+    return str(timedelta(seconds=round(seconds)))
+
+def print_summary(summary, bucket_seconds=BUCKET_SECONDS, show_throughput=False):
+    if summary["start"] is None:
+        print(f"{summary['file']}: no log lines")
+        return
+    wall = summary["end"] - summary["start"]
+    print(f"{summary['file']}: {format_seconds(wall)} "
+          f"({datetime.fromtimestamp(summary['start'])} to {datetime.fromtimestamp(summary['end'])})")
+    print(f"  answers: {summary['answers']} ({summary['paired']} timed, {summary['cached']} without a call), "
+          f"{summary['calls']} call(s), {summary['unanswered']} never answered")
+    hist = summary["latency_hist"]
+    if summary["paired"]:
+        p50, p90, p99 = (percentile(hist, q) for q in (0.5, 0.9, 0.99))
+        print(f"  latency: mean {summary['latency_sum'] / summary['paired']:.1f}s  "
+              f"p50 {p50}s  p90 {p90}s  p99 {p99}s  max {summary['latency_max']}s")
+        for model, stats in sorted(summary["models"].items()):
+            print(f"    {model}: {stats['paired']} answer(s), mean {stats['latency_sum'] / stats['paired']:.1f}s")
+    # of the logs' own time spans, which overlap when logs are merged
+    idle_share = summary["idle"] / summary["log_time"] if summary["log_time"] else 0
+    print(f"  idle: {format_seconds(summary['idle'])} ({idle_share:.1%}) with no request in flight; "
+          f"retry sleep {summary['retry_sleep']:.1f}s over {summary['retries']} retr{'y' if summary['retries'] == 1 else 'ies'}")
+    buckets = summary["throughput"]
+    if buckets:
+        rates = [buckets.get(b, 0) for b in range(min(buckets), max(buckets) + 1, bucket_seconds)]
+        print(f"  throughput: {summary['answers'] / wall * 60 if wall else 0:.2f} answers/min overall, "
+              f"{max(rates)} in the busiest {bucket_seconds}s, {rates.count(0)} empty bucket(s) of {len(rates)}")
+        if show_throughput:
+            for b in range(min(buckets), max(buckets) + 1, bucket_seconds):
+                n = buckets.get(b, 0)
+                print(f"    {datetime.fromtimestamp(b):%Y-%m-%d %H:%M:%S}  {n:>4}  {'#' * n}")
+
+def log_path(name):
+    # a log file, or the name of a run whose log is in LOG_DIR
+    if os.path.exists(name):
+        return name
+    return f"{ledger.LOG_DIR}/{Path(name).stem}.log"
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-question latency, idle time and throughput from solver logs")
+    parser.add_argument("logs", nargs="+", help="log files or run names")
+    parser.add_argument("--bucket", type=int, default=BUCKET_SECONDS, help="throughput bucket width (s)")
+    parser.add_argument("--throughput", action="store_true", help="print every throughput bucket")
+    parser.add_argument("--questions", metavar="DIR", help="write <log>_questions.csv files here")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--json", action="store_true", help="print the summaries as JSON")
+    parser.add_argument("--duration-only", action="store_true",
+                        help="only print each run's duration (from the ledger, else the log's first and last lines)")
+    args = parser.parse_args()
+
+    if args.duration_only:
+        for name in args.logs:
+            print(compute_log_duration(name) if os.path.exists(name) else run_duration(name))
+        return
+
+    paths = []
+    for name in args.logs:
+        path = log_path(name)
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            # a run without its log; the ledger may still know how long it took
+            print(f"{name}: {run_duration(name)} (no log)")
+    if not paths:
+        return
+    questions = [None] * len(paths)
+    if args.questions:
+        Path(args.questions).mkdir(parents=True, exist_ok=True)
+        questions = [str(Path(args.questions) / f"{Path(p).stem}_questions.csv") for p in paths]
+
+    buckets = [args.bucket] * len(paths)
+    if len(paths) > 1 and args.workers > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(paths))) as executor:
+            summaries = list(executor.map(analyze, paths, buckets, questions))
+    else:
+        summaries = [analyze(p, b, q) for p, b, q in zip(paths, buckets, questions)]
+    if len(summaries) > 1:
+        summaries.append(merge(summaries))
+
+    if args.json:
+        for s in summaries:
+            hist = s.pop("latency_hist")
+            s.update({f"latency_p{int(q * 100)}": percentile(hist, q) for q in (0.5, 0.9, 0.99)})
+        print(json.dumps(summaries, indent=2))
+        return
+    for s in summaries:
+        print_summary(s, args.bucket, args.throughput)
+
+if __name__ == '__main__':
+    main()
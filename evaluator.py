@@ -1,108 +1,293 @@
+import argparse
 import json
-import sys
+from datetime import datetime
+from pathlib import Path
 
-RESULT_DIR = "results"
+import numpy as np
+import pandas as pd
+
+import answer_key
+import archive
+import ledger
+import pricing
+import vote
 
-RESULT_FILE = sys.argv[1]
+RESULT_DIR = "results"
 
+SUBJECTS = ['math', 'physics', 'chemistry']
 
 def score_sca(gold, pred):
-    if gold == 'BONUS' or pred == gold:
-        return 3
-    if pred is None or pred == 'O':
-        return 0
-    return -1
+    return answer_key.score(answer_key.parse_answer('SCA', gold), pred)
 
 def score_m(gold, pred):
-    if gold == 'BONUS' or pred == gold:
-        return 4
-    if pred is None or pred == 'O':
-        return 0
-    return -1
+    return answer_key.score(answer_key.parse_answer('M', gold), pred)
 
 def score_mca(gold, pred):
-    if gold == 'BONUS':
-        return 4
-    if pred is None or pred == 'O':
-        return 0
-    pred_set = set(pred.split(','))
-    gold_set = set(gold)
+    return answer_key.score(answer_key.parse_answer('MCA', gold), pred)
 
-    if pred_set.intersection(gold_set) == gold_set:
-        return 4
-    if pred_set.intersection(gold_set) == pred_set:
-        return len(pred_set)
+def score_nt(gold, pred):
+    return answer_key.score(answer_key.parse_answer('NT', gold), pred)
 
-    return -1
+score_funcs = {
+    'SCA': score_sca,
+    'MCA': score_mca,
+    'NT': score_nt,
+    'M': score_m
+}
 
-def score_nt(gold, pred):
-    if gold == 'BONUS':
-        return 4
+max_scores = answer_key.MAX_SCORES
 
-    if '|' in gold:
-        gold_cdts = gold.split('|')
-    else:
-        gold_cdts = [gold]
+# -------------------------------------------------
+# Loading
+# -------------------------------------------------
+
+def parse_result_file(path):
+    # (paper, model); mock runs keep their prefix on the model, so their
+    # replayed answers never count towards the real model
+    stem = Path(path).stem
+    match = ledger.RUN_RGX.match(stem)
+    if match is None:
+        return None, stem
+    prefix = ledger.MOCK_PREFIX if stem.startswith(ledger.MOCK_PREFIX) else ""
+    return int(match.group(1)), prefix + match.group(2)
+
+def file_price(path):
+    # the price of a result file's model when its run started, or None
+    match = ledger.RUN_RGX.match(Path(path).stem)
+    if match is None:
+        return None
+    version = pricing.price_version(datetime.fromtimestamp(ledger.parse_run_time(match.group(3))))
+    try:
+        return pricing.price_for(match.group(2), version)
+    except KeyError:
+        return None
+
+CURVE_FIELDS = ['samples', 'cancelled']  # record fields sample_curve reads
+
+def archive_frame(path):
+    # the scalar columns of an archive, and the samples of sampled runs;
+    # responses stay in the file, see question_response
+    with archive.Archive(path) as result_archive:
+        df = pd.DataFrame({f: result_archive.column(f) for f in archive.SCALAR_FIELDS})
+        df['output_tokens'] = pd.Series(result_archive.column('usage.output_tokens')).replace(archive.NO_VALUE, np.nan)
+        extras = result_archive.column('extra')
+    for field in CURVE_FIELDS:
+        if any(extra and field in extra for extra in extras):
+            df[field] = [extra.get(field) if extra else None for extra in extras]
+    df['row'] = range(len(df))
+    return df
+
+def load_results(paths):
+    # All questions of all files (JSON or .jra archives) in one table, one
+    # row per question.
+    frames = []
+    for path in paths:
+        paper, model = parse_result_file(path)
+        if archive.is_archive(path):
+            df = archive_frame(path)
+        else:
+            with open(path, 'r') as result_file:
+                results_json = json.load(result_file)
+            df = pd.DataFrame(results_json)
+            usage = pd.json_normalize([u or {} for u in df.pop('usage')]) if 'usage' in df else pd.DataFrame(index=df.index)
+            df['output_tokens'] = usage.get('output_tokens', np.nan)
+        df['file'] = str(path)
+        df['model'] = model
+        df['paper'] = paper
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    df['ans'] = df['ans'].astype(str)
+    # NaN where a record has no usage, so an unmeasured run does not look free
+    df['output_tokens'] = df['output_tokens'].astype(float)
+    return df
+
+def question_response(question):
+    # a table row's response, read from its archive when it was not loaded
+    if isinstance(question.get('response'), str) or not archive.is_archive(question['file']):
+        return question.get('response')
+    # opened per response, so no file handle outlives the read
+    with archive.Archive(question['file']) as result_archive:
+        return result_archive.response(int(question['row']))
+
+def load_ledger(names=None, db=ledger.LEDGER_FILE, conn=None):
+    # Same table as load_results, read from the run ledger; `file` holds the
+    # run name. Answers come from the ledger's key, so re-keyed papers score
+    # against the fix.
+    rows = ledger.results(conn or ledger.connect(db), names)
+    df = pd.DataFrame([dict(row) for row in rows],
+                      columns=['num', 'subject', 'type', 'ans', 'pred', 'response',
+                               'output_tokens', 'file', 'model', 'paper'])
+    df['output_tokens'] = df['output_tokens'].astype(float)
+    return df
+
+def use_dataset_keys(df):
+    # Swaps each record's stored answer for the one in the current dataset,
+    # so runs made before an answer key fix are scored against the fix.
+    df = df.copy()
+    for paper in df['paper'].dropna().unique():
+        index = answer_key.load_index(int(paper))
+        rows = df['paper'] == paper
+        current = [index.get((s, int(n))) for s, n in zip(df.loc[rows, 'subject'], df.loc[rows, 'num'])]
+        df.loc[rows, 'ans'] = [a.text if a else ans for a, ans in zip(current, df.loc[rows, 'ans'])]
+    return df
 
-    for gold_cdt in gold_cdts:
-        if gold_cdt[0] == '[':
-            gold_range = [float(n) for n in gold_cdt[1:-1].split(',')]
-            if gold_range[0] <= float(pred) <= gold_range[1]:
-                return 4
-        elif float(pred) == float(gold_cdt):
-            return 4
-    return 0
+# -------------------------------------------------
+# Vectorized scoring
+#
+# Same marks as answer_key.score, computed for every row of the table at
+# once. Gold answers are compiled once per distinct (type, ans) and
+# predictions once per distinct value, then joined back onto the table.
+# -------------------------------------------------
+
+def compiled_keys(df):
+    answers = [answer_key.parse_answer(t, a) for t, a in set(zip(df['type'], df['ans']))]
+    keys = pd.DataFrame(
+        [(a.qtype, a.text, a.bonus, a.mask) for a in answers],
+        columns=['type', 'ans', 'bonus', 'gold_mask'],
+    )
+    intervals = pd.DataFrame(
+        [(a.qtype, a.text, lo, hi) for a in answers for lo, hi in a.intervals],
+        columns=['type', 'ans', 'lo', 'hi'],
+    )
+    return keys, intervals
+
+def score_single(df, full_marks):
+    answered = df['pred'].notna() & (df['pred'] != 'O')
+    return np.select(
+        [df['bonus'], df['pred'] == df['ans'], ~answered],
+        [full_marks, full_marks, 0],
+        -1,
+    )
+
+def score_multi(df):
+    answered = df['pred'].notna() & (df['pred'] != 'O')
+    preds = df['pred'].where(answered)
+    masks = {p: answer_key.pred_mask(p) for p in preds.dropna().unique()}
+    pred = preds.map(masks).fillna(0).to_numpy(dtype=int)
+    gold = df['gold_mask'].to_numpy(dtype=int)
+    common = gold & pred
+    popcount = sum((pred >> i) & 1 for i in range(len(answer_key.OPTIONS) + 1))
+    return np.select(
+        [df['bonus'], ~answered, common == gold, common == pred],
+        [4, 0, 4, popcount],
+        -1,
+    )
+
+def score_numeric(df, intervals):
+    values = pd.to_numeric(df['pred'], errors='coerce').rename('value')
+    cdts = df[['type', 'ans']].join(values).reset_index().merge(intervals, on=['type', 'ans'])
+    hit = ((cdts['lo'] <= cdts['value']) & (cdts['value'] <= cdts['hi'])).groupby(cdts['index']).any()
+    return np.where(df['bonus'] | hit.reindex(df.index, fill_value=False), 4, 0)
+
+def score_table(df):
+    keys, intervals = compiled_keys(df)
+    df = df.reset_index(drop=True).merge(keys, on=['type', 'ans'], how='left')
+    df['score'] = 0
+    df['max_score'] = df['type'].map(max_scores)
+    for qtype, func in (('SCA', lambda d: score_single(d, 3)), ('M', lambda d: score_single(d, 4)),
+                        ('MCA', score_multi), ('NT', lambda d: score_numeric(d, intervals))):
+        mask = df['type'] == qtype
+        if mask.any():
+            df.loc[mask, 'score'] = func(df[mask])
+    df['correct'] = df['score'] >= 3
+    return df
+
+def score_matrix(df):
+    # model x paper rows, one column per subject plus the paper total
+    matrix = df.pivot_table(index=['model', 'paper'], columns='subject', values='score',
+                            aggfunc='sum', fill_value=0)
+    matrix = matrix.reindex(columns=[s for s in SUBJECTS if s in matrix.columns])
+    matrix['total'] = matrix.sum(axis=1)
+    matrix['max'] = df.groupby(['model', 'paper'])['max_score'].sum()
+    return matrix
+
+def token_table(df):
+    tokens = df.pivot_table(index=['model', 'paper'], columns='correct', values='output_tokens',
+                            aggfunc='mean')
+    tokens = tokens.rename(columns={True: 'correct', False: 'incorrect'})
+    tokens.columns.name = None
+    # runs without usage stay in the table, as NaN rather than 0
+    runs = df.groupby(['model', 'paper']).size().index
+    return tokens.reindex(index=runs, columns=['correct', 'incorrect'])
+
+def sample_curve(questions, price=None):
+    # Score, output tokens and cost (at `price`, when given) if only the
+    # first n samples of each question had been voted on, for every n up to
+    # the most samples taken. `questions` are one file's rows of the loaded
+    # table. Samples the quorum cancelled count towards the tokens and cost
+    # from their place on; `unknown` is how many of them had no usage yet, so
+    # the tokens and cost are a lower bound when it is not 0.
+    questions = [(q, listed(q.get('samples')) or [q], listed(q.get('cancelled'))) for q in questions]
+    k = max(max([len(samples)] + [c['sample'] + 1 for c in cancelled]) for _, samples, cancelled in questions)
+    curve = []
+    for n in range(1, k + 1):
+        score = 0
+        unknown = 0
+        usage = {}
+        for question, samples, cancelled in questions:
+            samples = samples[:n]
+            pred, _ = vote.vote(question['type'], [s['pred'] for s in samples])
+            score += score_funcs[question['type']](question['ans'], pred)
+            cancelled = [c for c in cancelled if c['sample'] < n]
+            unknown += sum(1 for c in cancelled if c['usage'] is None)
+            for sample in samples + [c for c in cancelled if c['usage'] is not None]:
+                for field, count in (sample.get('usage') or {}).items():
+                    usage[field] = usage.get(field, 0) + count
+        cost = sum(pricing.usage_cost(usage, price).values()) if price else None
+        curve.append((n, score, usage.get('output_tokens', 0), cost, unknown))
+    return curve
+
+def listed(value):
+    # a list field of a table row; NaN where the record has none
+    return value if isinstance(value, list) else []
 
 def main():
+    parser = argparse.ArgumentParser(description="Score result files")
+    parser.add_argument('result_files', nargs='*',
+                        help="result files, or run names with --ledger (default: every run in the ledger)")
+    parser.add_argument('--show-responses', action='store_true',
+                        help="print the response of every incorrect answer")
+    parser.add_argument('--dataset-keys', action='store_true',
+                        help="score against the current dataset answers, not the ones stored in the results")
+    parser.add_argument('--ledger', nargs='?', const=ledger.LEDGER_FILE, metavar='DB',
+                        help="read the runs from the run ledger instead of result files")
+    args = parser.parse_args()
+    if not args.result_files and not args.ledger:
+        parser.error("give result files or --ledger")
+
+    if args.ledger:
+        df = load_ledger(args.result_files, args.ledger)
+    else:
+        df = load_results(args.result_files)
+    if args.dataset_keys:
+        df = use_dataset_keys(df)
+    df = score_table(df)
+
+    if args.show_responses:
+        for _, question in df[~df['correct']].iterrows():
+            print(f"---------")
+            print(f"{question['subject']} Q{question['num']} incorrect: expected {question['ans']}, got {question['pred']}")
+            print(question_response(question))
+            print(f"---------")
+
+    with pd.option_context('display.width', 120, 'display.max_rows', None):
+        print(score_matrix(df).to_string())
+        print("")
+        print("output tokens/q")
+        print(token_table(df).round(1).to_string(na_rep='-'))
 
-    score_funcs = {
-        'SCA': score_sca,
-        'MCA': score_mca,
-        'NT': score_nt,
-        'M': score_m
-    }
-
-    max_scores = {
-        'SCA': 3,
-        'MCA': 4,
-        'NT': 4,
-        'M': 4
-    }
-
-    score = 0
-    max_score = 0
-    score_by_subject = {'math': 0, 'physics': 0, 'chemistry': 0}
-    correct_output_token_counts = 0
-    incorrect_output_token_counts = 0
-    num_correct = 0
-    num_incorrect = 0
-    with open(RESULT_FILE, 'r') as result_file:
-        results_json = json.load(result_file)
-        for question in results_json:
-            q_score = score_funcs[question['type']](question['ans'], question['pred'])
-            if q_score < 3:
-                print(f"---------")
-                print(f"{question['subject']} Q{question['num']} incorrect: expected {question['ans']}, got {question['pred']}")
-                print(question['response'])
-                print(f"---------")
-                num_incorrect += 1
-                if 'usage' in question:
-                    incorrect_output_token_counts += question['usage']['output_tokens']
-            else:
-                num_correct += 1
-                if 'usage' in question:
-                    correct_output_token_counts += question['usage']['output_tokens']
-            score += q_score
-            max_score += max_scores[question['type']]
-            score_by_subject[question['subject']] += q_score
-
-    print(f"{score}/{max_score}")
-    for subject, score in score_by_subject.items():
-        print(subject, f"{score}/{max_score//3}")
-
-    print("")
-    print(f"output tokens/q for correct answers: {correct_output_token_counts/num_correct}")
-    print(f"output tokens/q for incorrect answers: {incorrect_output_token_counts/num_incorrect}")
+    # from the loaded table; only files of sampled runs have a samples column
+    files = [] if args.ledger or 'samples' not in df else df.groupby('file', sort=False)
+    for path, questions in files:
+        curve = sample_curve(questions.to_dict('records'), file_price(path))
+        if len(curve) > 1:
+            print("")
+            print(path)
+            print("samples  score  output tokens    cost ($)")
+            for n, n_score, output_tokens, cost, unknown in curve:
+                cost = f"{cost:.4f}" if cost is not None else "-"
+                more = f"  + {unknown} cancelled sample(s) of unknown usage" if unknown else ""
+                print(f"{n:>7}  {n_score:>5}  {output_tokens:>13}  {cost:>10}{more}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,292 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageChops
+except ImportError:
+    Image = None
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+DATA_DIR   = "dataset"
+IMAGE_DIR  = f"{DATA_DIR}/images"
+STORE_FILE = "cache/images.bin"
+INDEX_FILE = "cache/images.json"
+MAX_SIDE   = None  # px; longest side images are shrunk to when building (needs Pillow)
+
+VARIANT_DIR     = "cache/image_variants"
+VARIANTS        = {"optimized": 1536, "thumb": 256}  # longest side of each variant, px
+VARIANT_WORKERS = 2
+# Send the optimized variant, when built, instead of the original. Off by
+# default: the variants are flattened and quantized, so they change the
+# benchmark's inputs (and every response cache key) and runs made with them
+# are not comparable with the published ones. solver.py --optimized-images.
+USE_OPTIMIZED   = False
+
+# images named by their content, see ingest()
+HASH_NAME_RGX = re.compile(r"^[0-9a-f]{16}\.[a-z0-9]+$")
+
+# -------------------------------------------------
+# Ingestion
+#
+# Uploaded images are named by the sha256 of their bytes, so the same image
+# uploaded twice is stored once and a name never changes content (which is
+# what lets the annotator serve them as immutable). Writing through a
+# temporary file and os.replace keeps concurrent uploads of the same image
+# from seeing half a file.
+#
+# Every image gets resized variants under VARIANT_DIR/<variant>/<stem>.png,
+# made in a background thread after an upload, or all at once by
+# `python images.py`:
+#   optimized  for the solver, when asked for (USE_OPTIMIZED): alpha
+#              flattened onto white, grayscale or a 256-colour palette, at
+#              most VARIANTS["optimized"] px; the original's bytes when that
+#              is not smaller
+#   thumb      for the annotator's previews
+# -------------------------------------------------
+
+def content_name(data, ext=".png"):
+    return hashlib.sha256(data).hexdigest()[:16] + ext.lower()
+
+def write_atomic(path, data):
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+def ingest(data, ext=".png", image_dir=IMAGE_DIR):
+    # (name, created) of the stored image; variants are made in the background
+    name = content_name(data, ext)
+    path = Path(image_dir) / name
+    created = not path.exists()
+    if created:
+        Path(image_dir).mkdir(parents=True, exist_ok=True)
+        write_atomic(path, data)
+    schedule_variants(path)
+    return name, created
+
+def variant_path(key, variant, variant_dir=VARIANT_DIR):
+    # key is the image path as written in the questions, e.g. images/foo.png
+    return Path(variant_dir) / variant / f"{Path(key).stem}.png"
+
+def current_variant(key, variant, data_dir=DATA_DIR, variant_dir=VARIANT_DIR):
+    # the variant's path if it was made from the image as it is now, else None
+    path = variant_path(key, variant, variant_dir)
+    try:
+        if path.stat().st_mtime_ns >= (Path(data_dir) / key).stat().st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    return None
+
+def flatten(image):
+    # RGB on white, or L when no pixel has colour
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        background.alpha_composite(image)
+        image = background
+    image = image.convert("RGB")
+    gray = image.convert("L")
+    if all(ImageChops.difference(channel, gray).getextrema()[1] <= 2 for channel in image.split()):
+        return gray
+    return image
+
+def make_variant(path, variant, max_side, variant_dir=VARIANT_DIR, data_dir=DATA_DIR):
+    key = Path(path).relative_to(data_dir).as_posix()
+    target = variant_path(key, variant, variant_dir)
+    with open(path, "rb") as f:
+        data = f.read()
+    image = flatten(Image.open(io.BytesIO(data)))
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode == "RGB":
+        image = image.quantize(256)
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=True)
+    if variant == "optimized" and out.tell() >= len(data) and Path(path).suffix.lower() == ".png":
+        out = io.BytesIO(data)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(target, out.getvalue())
+    return target
+
+def make_variants(path, variant_dir=VARIANT_DIR, data_dir=DATA_DIR):
+    # the variants of one image that are missing or older than it
+    key = Path(path).relative_to(data_dir).as_posix()
+    made = []
+    for variant, max_side in VARIANTS.items():
+        if current_variant(key, variant, data_dir, variant_dir) is None:
+            made.append(make_variant(path, variant, max_side, variant_dir, data_dir))
+    return made
+
+_variant_pool = None
+_variant_lock = threading.Lock()
+
+def schedule_variants(path):
+    global _variant_pool
+    if Image is None:
+        return None
+    with _variant_lock:
+        if _variant_pool is None:
+            _variant_pool = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix="variants")
+    future = _variant_pool.submit(make_variants, path)
+    future.add_done_callback(
+        lambda f: f.exception() and logger.error("Making variants of %s failed: %s", path, f.exception()))
+    return future
+
+def build_variants(image_dir=IMAGE_DIR, workers=VARIANT_WORKERS):
+    if Image is None:
+        logger.warning("Pillow is not installed, no image variants made")
+        return []
+    paths = [p for p in sorted(Path(image_dir).iterdir()) if p.is_file()]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [v for made in pool.map(make_variants, paths) for v in made]
+
+# -------------------------------------------------
+# Image payload store
+#
+# Every image is base64-encoded once at build time and written back to back
+# into STORE_FILE; INDEX_FILE maps each image path (as written in the
+# questions, e.g. images/foo.png) to its offset and length. The solver maps
+# the store into memory, so building a prompt is a slice instead of a file
+# read plus an encode. With USE_OPTIMIZED an image's optimized variant is
+# stored in its place when one is current; a store built one way is not
+# used for the other.
+# -------------------------------------------------
+
+def image_source(key, data_dir=DATA_DIR, optimized=None):
+    # the file sent for an image: its optimized variant when asked for and current
+    if USE_OPTIMIZED if optimized is None else optimized:
+        variant = current_variant(key, "optimized", data_dir)
+        if variant is not None:
+            return variant
+    return Path(data_dir) / key
+
+def encode_image(path, max_side=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    mime = mimetypes.guess_type(str(path))[0] or "image/png"
+
+    if max_side and Image is not None:
+        image = Image.open(io.BytesIO(data))
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, format="PNG", optimize=True)
+            # shrinking can still lose to the original on tiny line drawings
+            if out.tell() < len(data):
+                data = out.getvalue()
+    elif max_side:
+        logger.warning("Pillow is not installed, storing %s at full size", path)
+
+    return mime, base64.b64encode(data)
+
+def build(image_dir=IMAGE_DIR, max_side=MAX_SIDE, store_file=STORE_FILE, index_file=INDEX_FILE,
+          optimized=None):
+    Path(store_file).parent.mkdir(parents=True, exist_ok=True)
+    index = {}
+    offset = 0
+    with open(store_file, "wb") as store:
+        for path in sorted(Path(image_dir).iterdir()):
+            if not path.is_file():
+                continue
+            stat = path.stat()
+            key = path.relative_to(DATA_DIR).as_posix()
+            source = image_source(key, optimized=optimized)
+            mime, payload = encode_image(source, max_side)
+            store.write(payload)
+            index[key] = {
+                "source": source.as_posix(),
+                "offset": offset,
+                "length": len(payload),
+                "mime": mime,
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            }
+            offset += len(payload)
+
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump({"max_side": max_side, "images": index}, f, indent=2)
+
+    return index
+
+class ImageStore:
+    def __init__(self, store_file=STORE_FILE, index_file=INDEX_FILE, optimized=None):
+        self.index = {}
+        self.data = None
+        self.memo = {}
+        self.optimized = USE_OPTIMIZED if optimized is None else optimized
+
+        if not (os.path.exists(store_file) and os.path.exists(index_file)):
+            logger.info("No image store at %s, encoding images from disk", store_file)
+            return
+
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)["images"]
+        # Entries whose image changed since the build, or that hold the other
+        # kind of source (original or optimized), are dropped here, once,
+        # rather than checked on every lookup.
+        for key, entry in index.items():
+            try:
+                stat = os.stat(Path(DATA_DIR) / key)
+            except OSError:
+                continue
+            if (stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]
+                    and entry["source"] == image_source(key, optimized=self.optimized).as_posix()):
+                self.index[key] = entry
+        if len(self.index) < len(index):
+            logger.warning("%d image(s) changed since the store was built, re-run images.py%s",
+                           len(index) - len(self.index), " --optimized" if self.optimized else "")
+
+        if os.path.getsize(store_file):
+            with open(store_file, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def data_url(self, path):
+        key = Path(path).as_posix()
+        if key in self.memo:
+            return self.memo[key]
+
+        entry = self.index.get(key)
+        if entry is not None and self.data is not None:
+            payload = self.data[entry["offset"]:entry["offset"] + entry["length"]]
+            mime = entry["mime"]
+        else:
+            mime, payload = encode_image(image_source(key, optimized=self.optimized))
+
+        url = f"data:{mime};base64,{payload.decode('ascii')}"
+        self.memo[key] = url
+        return url
+
+# -------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make image variants and pre-encode dataset images for the solver")
+    parser.add_argument("--max-side", type=int, default=MAX_SIDE,
+                        help="shrink images whose longest side is larger than this (px)")
+    parser.add_argument("--workers", type=int, default=VARIANT_WORKERS)
+    parser.add_argument("--optimized", action="store_true",
+                        help="store the optimized variants, for solver.py --optimized-images")
+    args = parser.parse_args()
+
+    made = build_variants(workers=args.workers)
+    print(f"Made {len(made)} image variant(s) in {VARIANT_DIR}")
+    index = build(max_side=args.max_side, optimized=args.optimized)
+    raw = sum(e["size"] for e in index.values())
+    encoded = sum(e["length"] for e in index.values())
+    optimized = sum(1 for e in index.values() if e["source"].startswith(VARIANT_DIR))
+    print(f"Stored {len(index)} image(s) in {STORE_FILE} ({optimized} optimized): "
+          f"{raw} bytes on disk, {encoded} bytes encoded")
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+
+# -------------------------------------------------
+# Append-only result journal
+#
+# Every answered question is appended as one JSON line, so a crash loses at
+# most the line being written. A line cut short that way is closed off by
+# the next append, so it never swallows the record after it. Records carry
+# the paper and model alongside the usual result fields so they can be
+# keyed without relying on the file name.
+#
+# The first line may instead hold the options the run was started with,
+# {"settings": {...}}, so a resumed run asks its remaining questions the
+# same way.
+# -------------------------------------------------
+
+# fields that only exist in the journal, not in the compacted result file
+JOURNAL_FIELDS = ("paper", "model")
+SETTINGS_FIELD = "settings"
+
+def record_key(record):
+    return (int(record["paper"]), record["subject"], int(record["num"]), record["model"])
+
+# the solver appends from worker threads; one append (and fsync) at a time
+append_lock = threading.Lock()
+
+def append(path, record):
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    with append_lock, open(path, "a+b") as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                line = b"\n" + line
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_settings(path, settings):
+    # once, before the first record; a resumed run keeps its original line
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        append(path, {SETTINGS_FIELD: settings})
+
+def load_settings(path):
+    # the settings the run was started with, or None for a journal without them
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            first = json.loads(f.readline())
+        except json.JSONDecodeError:
+            return None
+    return first.get(SETTINGS_FIELD) if isinstance(first, dict) else None
+
+def load(path):
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by a crash mid-write; the question is re-asked
+                continue
+            if SETTINGS_FIELD in record:
+                continue
+            records[record_key(record)] = record
+    return records
+
+def compact(path, output_file, order=None):
+    # Writes the journal out in the usual result file format. `order` is a
+    # list of keys (normally the dataset order); records not in it follow in
+    # journal order.
+    records = load(path)
+    keys = [k for k in order if k in records] if order else []
+    seen = set(keys)
+    keys += [k for k in records if k not in seen]
+
+    results = []
+    for key in keys:
+        record = dict(records[key])
+        for field in JOURNAL_FIELDS:
+            record.pop(field, None)
+        results.append(record)
+
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, output_file)
+
+    return results
@@ -0,0 +1,339 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+
+import archive
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+LEDGER_FILE = "results/ledger.db"
+DATA_DIR    = "dataset"
+LOG_DIR     = "logs"
+RESULT_DIR  = "results"
+
+# run names, as made by solver.run_name: jeea25_p<paper>_<model>_<time>[-<repeat>];
+# every script that parses run or result file names uses this one
+RUN_RGX = re.compile(r"^(?:DEBUG_|MOCK_)?jeea25_p(\d+)_(.+)_(\d{8}T\d{6})(?:-(\d+))?$")
+MOCK_PREFIX = "MOCK_"  # runs answered by mock_server.py
+LOG_TIME_RGX = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)")
+
+# -------------------------------------------------
+# Schema
+#
+# runs       one row per run, keyed by run name
+# questions  the answer key, one row per question of a paper; runs share it,
+#            so re-keying a paper is one UPDATE per question
+# responses  what a run answered for a question
+# usage      token counts of that answer (summed over samples)
+# timings    when the answer arrived, plus the stream timing if recorded
+# -------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    name     TEXT PRIMARY KEY,
+    paper    INTEGER NOT NULL,
+    model    TEXT NOT NULL,
+    sample   INTEGER NOT NULL DEFAULT 0,
+    batch    INTEGER NOT NULL DEFAULT 0,
+    started  REAL,
+    finished REAL,
+    source   TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_model_paper ON runs (model, paper);
+
+CREATE TABLE IF NOT EXISTS questions (
+    paper   INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    num     INTEGER NOT NULL,
+    type    TEXT NOT NULL,
+    ans     TEXT NOT NULL,
+    PRIMARY KEY (paper, subject, num)
+);
+
+CREATE TABLE IF NOT EXISTS responses (
+    run      TEXT NOT NULL REFERENCES runs (name),
+    subject  TEXT NOT NULL,
+    num      INTEGER NOT NULL,
+    pred     TEXT,
+    response TEXT,
+    samples  INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (run, subject, num)
+);
+
+CREATE TABLE IF NOT EXISTS usage (
+    run                 TEXT NOT NULL REFERENCES runs (name),
+    subject             TEXT NOT NULL,
+    num                 INTEGER NOT NULL,
+    input_tokens        INTEGER NOT NULL DEFAULT 0,
+    cached_input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens       INTEGER NOT NULL DEFAULT 0,
+    reasoning_tokens    INTEGER NOT NULL DEFAULT 0,
+    total_tokens        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run, subject, num)
+);
+
+CREATE TABLE IF NOT EXISTS timings (
+    run            TEXT NOT NULL REFERENCES runs (name),
+    subject        TEXT NOT NULL,
+    num            INTEGER NOT NULL,
+    answered_at    REAL,
+    ttft           REAL,
+    answer_at      REAL,
+    latency        REAL,
+    tokens_per_sec REAL,
+    PRIMARY KEY (run, subject, num)
+);
+"""
+
+USAGE_FIELDS  = ["input_tokens", "cached_input_tokens", "output_tokens", "reasoning_tokens", "total_tokens"]
+TIMING_FIELDS = ["ttft", "answer_at", "latency", "tokens_per_sec"]
+
+def connect(path=LEDGER_FILE, check_same_thread=True):
+    # check_same_thread=False for a connection that is shared between
+    # threads, one statement at a time (solver.py's writes)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    # WAL keeps readers (cost, evaluator) from blocking a running solver
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # ledgers created before runs had a batch flag
+    if "batch" not in {row["name"] for row in conn.execute("PRAGMA table_info(runs)")}:
+        conn.execute("ALTER TABLE runs ADD COLUMN batch INTEGER NOT NULL DEFAULT 0")
+    return conn
+
+# -------------------------------------------------
+# Writing
+# -------------------------------------------------
+
+def parse_run_time(run_time):
+    return datetime.strptime(run_time, "%Y%m%dT%H%M%S").timestamp()
+
+def start_run(conn, run, started=None, source=None):
+    match = RUN_RGX.match(run["name"])
+    if started is None and match:
+        started = parse_run_time(match.group(3))
+    with conn:
+        conn.execute(
+            "INSERT INTO runs (name, paper, model, sample, batch, started, source) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET source = coalesce(excluded.source, source), "
+            "batch = max(batch, excluded.batch)",
+            (run["name"], run["paper"], run["model"], run.get("sample", 0), int(run.get("batch", False)),
+             started, source),
+        )
+
+def finish_run(conn, run, finished=None):
+    with conn:
+        conn.execute("UPDATE runs SET finished = ? WHERE name = ?",
+                     (finished if finished is not None else time.time(), run["name"]))
+
+def question_row(paper, result):
+    return (paper, result["subject"], int(result["num"]), result["type"], str(result["ans"]))
+
+def result_rows(name, result, answered_at=None):
+    # (response, usage, timing) rows; no usage row for a result without usage
+    key = (name, result["subject"], int(result["num"]))
+    usage = result.get("usage")
+    timing = result.get("timing") or {}
+    return (
+        key + (result.get("pred"), result.get("response"), len(result.get("samples") or [None])),
+        key + tuple(usage.get(f, 0) for f in USAGE_FIELDS) if usage else None,
+        key + (answered_at,) + tuple(timing.get(f) for f in TIMING_FIELDS),
+    )
+
+def write_results(conn, run, results, answered_at=None):
+    # The answer key is shared by every run on the paper, so a result only
+    # adds the questions the ledger does not have yet; an older file with a
+    # stale key must not re-key the other runs. Changing the key is rekey's job.
+    questions = [question_row(run["paper"], r) for r in results]
+    rows = [result_rows(run["name"], r, answered_at) for r in results]
+    with conn:
+        conn.executemany(
+            "INSERT INTO questions (paper, subject, num, type, ans) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING", questions)
+        conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                         [r[0] for r in rows])
+        conn.executemany("INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [r[1] for r in rows if r[1]])
+        # ledgers written before usage could be missing hold zeros for it
+        conn.executemany("DELETE FROM usage WHERE run = ? AND subject = ? AND num = ?",
+                         [r[0][:3] for r in rows if not r[1]])
+        conn.executemany("INSERT OR REPLACE INTO timings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [r[2] for r in rows])
+
+def record(conn, run, result):
+    # one answer, written as it arrives
+    write_results(conn, run, [result], time.time())
+
+# -------------------------------------------------
+# Importing result files
+# -------------------------------------------------
+
+def log_span(name, log_dir=LOG_DIR):
+    # (first, last) timestamp of the run's log, if it is still around
+    path = f"{log_dir}/{name}.log"
+    if not os.path.exists(path):
+        return None, None
+    times = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = LOG_TIME_RGX.match(line)
+            if match:
+                times.append(match.group(1))
+    if not times:
+        return None, None
+    parse = lambda t: datetime.strptime(t, "%Y-%m-%d %H:%M:%S").timestamp()
+    return parse(times[0]), parse(times[-1])
+
+def batch_run(name, path=None, result_dir=RESULT_DIR):
+    # whether a run went through the Batch API: solver.py --batch keeps its
+    # request file, <run>_batch.jsonl, in the result directory
+    dirs = {result_dir} | ({str(Path(path).parent)} if path else set())
+    return any(os.path.exists(f"{d}/{name}_batch.jsonl") for d in dirs)
+
+def import_file(conn, path):
+    name = Path(path).stem
+    match = RUN_RGX.match(name)
+    if match is None:
+        raise ValueError(f"Not a run name: {name}")
+    if name.startswith(MOCK_PREFIX):
+        raise ValueError(f"{name} is a mock run; its answers are replays")
+    paper, model, _, repeat = match.groups()
+    run = {"name": name, "paper": int(paper), "model": model,
+           "sample": int(repeat) - 1 if repeat else 0, "batch": batch_run(name, path)}
+
+    results = archive.load(path)
+
+    started, finished = log_span(name)
+    start_run(conn, run, started, source=str(path))
+    write_results(conn, run, results)
+    if finished is not None:
+        finish_run(conn, run, finished)
+    return len(results)
+
+# -------------------------------------------------
+# Queries
+# -------------------------------------------------
+
+def runs(conn, model=None, paper=None):
+    query = (
+        "SELECT r.name, r.paper, r.model, r.sample, r.batch, r.started, r.finished, "
+        "count(s.num) AS questions, count(u.num) AS with_usage, "
+        + ", ".join(f"coalesce(sum(u.{f}), 0) AS {f}" for f in USAGE_FIELDS) +
+        " FROM runs r LEFT JOIN responses s ON s.run = r.name "
+        "LEFT JOIN usage u ON u.run = s.run AND u.subject = s.subject AND u.num = s.num"
+    )
+    where, params = [], []
+    if model is not None:
+        where.append("r.model = ?"); params.append(model)
+    if paper is not None:
+        where.append("r.paper = ?"); params.append(paper)
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " GROUP BY r.name ORDER BY r.model, r.paper, r.name"
+    return conn.execute(query, params).fetchall()
+
+def run_info(conn, name):
+    return conn.execute("SELECT * FROM runs WHERE name = ?", (name,)).fetchone()
+
+def run_usage(conn, name):
+    # {field: total} over the run's answers; every total is None when some
+    # answer has no usage recorded, as a partial sum would look cheap
+    row = conn.execute(
+        "SELECT count(*) AS answers, count(u.num) AS with_usage, "
+        + ", ".join(f"coalesce(sum(u.{f}), 0) AS {f}" for f in USAGE_FIELDS) +
+        " FROM responses s LEFT JOIN usage u ON u.run = s.run AND u.subject = s.subject AND u.num = s.num "
+        "WHERE s.run = ?", (name,)).fetchone()
+    if row["with_usage"] < row["answers"]:
+        return dict.fromkeys(USAGE_FIELDS)
+    return {f: row[f] for f in USAGE_FIELDS}
+
+def run_duration(conn, name):
+    # seconds from the run's start to its last answer (or its finish time);
+    # None when neither is known
+    row = conn.execute(
+        "SELECT r.started, r.finished, max(t.answered_at) AS last_answer "
+        "FROM runs r LEFT JOIN timings t ON t.run = r.name WHERE r.name = ?", (name,)).fetchone()
+    if row is None or row["started"] is None:
+        return None
+    end = row["last_answer"] or row["finished"]
+    return end - row["started"] if end is not None else None
+
+def results(conn, names=None):
+    # rows shaped like result file records (plus model, paper and the run
+    # name as `file`), with the answer key as it is in the ledger now
+    query = (
+        "SELECT q.num, q.subject, q.type, q.ans, s.pred, s.response, u.output_tokens, "
+        "r.name AS file, r.model, r.paper "
+        "FROM responses s "
+        "JOIN runs r ON r.name = s.run "
+        "JOIN questions q ON q.paper = r.paper AND q.subject = s.subject AND q.num = s.num "
+        "LEFT JOIN usage u ON u.run = s.run AND u.subject = s.subject AND u.num = s.num"
+    )
+    params = []
+    if names:
+        query += f" WHERE r.name IN ({', '.join('?' * len(names))})"
+        params = list(names)
+    return conn.execute(query, params).fetchall()
+
+def rekey(conn, paper, data_dir=DATA_DIR):
+    # Replaces a paper's answer key with the dataset CSV's; every run on the
+    # paper is scored against it from then on. Returns the answers changed.
+    with open(f"{data_dir}/jeea25_p{paper}.csv", newline="", encoding="utf-8") as f:
+        rows = [(row["type"], row["ans"], paper, row["subject"], int(row["num"]))
+                for row in csv.DictReader(f)]
+    with conn:
+        before = conn.total_changes
+        conn.executemany(
+            "UPDATE questions SET type = ?1, ans = ?2 "
+            "WHERE paper = ?3 AND subject = ?4 AND num = ?5 AND (type != ?1 OR ans != ?2)", rows)
+        return conn.total_changes - before
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ledger: one store for every run's answers and metadata")
+    parser.add_argument("--db", default=LEDGER_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="add result files to the ledger")
+    importer.add_argument("result_files", nargs="+")
+
+    lister = commands.add_parser("runs", help="list runs with their token usage and duration")
+    lister.add_argument("--model")
+    lister.add_argument("--paper", type=int)
+
+    rekeyer = commands.add_parser("rekey", help="update a paper's answer key from the dataset")
+    rekeyer.add_argument("paper", type=int)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+
+    if args.command == "import":
+        for path in args.result_files:
+            n = import_file(conn, path)
+            print(f"Imported {n} question(s) from {path}")
+
+    elif args.command == "runs":
+        print(f"{'run':<42} {'qs':>4} {'input':>10} {'cached':>7} {'output':>10} {'duration':>10}")
+        for row in runs(conn, args.model, args.paper):
+            duration = run_duration(conn, row["name"])
+            duration = "-" if duration is None else f"{duration / 60:.1f}m"
+            if row["with_usage"] < row["questions"]:
+                print(f"{row['name']:<42} {row['questions']:>4} {'-':>10} {'-':>7} {'-':>10} {duration:>10}")
+                continue
+            # share of input tokens served from OpenAI's prompt cache
+            cached = row["cached_input_tokens"] / row["input_tokens"] if row["input_tokens"] else 0
+            print(f"{row['name']:<42} {row['questions']:>4} {row['input_tokens']:>10} {cached:>7.1%} "
+                  f"{row['output_tokens']:>10} {duration:>10}")
+
+    elif args.command == "rekey":
+        print(f"Updated {rekey(conn, args.paper)} answer(s) of paper {args.paper}")
+
+if __name__ == "__main__":
+    main()
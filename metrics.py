@@ -0,0 +1,145 @@
+import csv
+import logging
+import math
+from collections import defaultdict
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Run metrics
+#
+# One sample per answered request (k per question when sampling). Times
+# are in seconds: queue_time is spent waiting for a request slot,
+# limit_wait waiting on the model's rate limiter once it has one,
+# api_latency is the successful API call (0 for cache hits), and retries
+# counts both scheduler retries and re-queues.
+# -------------------------------------------------
+
+FIELDS = [
+    "run", "model", "paper", "subject", "num", "sample", "cached",
+    "queue_time", "limit_wait", "api_latency", "retries", "bytes_sent",
+    "input_tokens", "cached_input_tokens", "output_tokens", "reasoning_tokens",
+]
+TIMED_FIELDS = ["queue_time", "limit_wait", "api_latency"]
+COUNTED_FIELDS = ["retries", "bytes_sent", "input_tokens", "cached_input_tokens",
+                  "output_tokens", "reasoning_tokens"]
+QUANTILES = [0.5, 0.95, 0.99]
+
+PROM_PREFIX = "jeebench"
+
+def percentile(values, q):
+    # linear interpolation between closest ranks, like numpy's default
+    values = sorted(values)
+    if not values:
+        return math.nan
+    pos = (len(values) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+class RunMetrics:
+    def __init__(self):
+        self.samples = []
+
+    def record(self, run, row, stats, usage):
+        self.samples.append({
+            "run": run["name"],
+            "model": run["model"],
+            "paper": run["paper"],
+            "subject": row["subject"],
+            "num": int(row["num"]),
+            "sample": stats.get("sample", 0),
+            "cached": stats.get("cached", False),
+            "queue_time": round(stats.get("queue_time", 0), 3),
+            "limit_wait": round(stats.get("limit_wait", 0), 3),
+            "api_latency": round(stats.get("latency", 0), 3),
+            "retries": stats.get("retries", 0),
+            "bytes_sent": stats.get("bytes_sent", 0),
+            "input_tokens": usage["input_tokens"],
+            "cached_input_tokens": usage["cached_input_tokens"],
+            "output_tokens": usage["output_tokens"],
+            "reasoning_tokens": usage["reasoning_tokens"],
+        })
+
+    def by_model(self):
+        groups = defaultdict(list)
+        for sample in self.samples:
+            groups[sample["model"]].append(sample)
+        return groups
+
+    def summary(self):
+        # {model: {field: {quantile: value}}}, timings over API calls only
+        summary = {}
+        for model, samples in self.by_model().items():
+            called = [s for s in samples if not s["cached"]]
+            summary[model] = {
+                field: {q: percentile([s[field] for s in called], q) for q in QUANTILES}
+                for field in TIMED_FIELDS + ["output_tokens"]
+            }
+        return summary
+
+    def prompt_cache_ratio(self):
+        # {model: share of input tokens served from OpenAI's prompt cache},
+        # over API calls only
+        ratios = {}
+        for model, samples in self.by_model().items():
+            called = [s for s in samples if not s["cached"]]
+            input_tokens = sum(s["input_tokens"] for s in called)
+            cached = sum(s["cached_input_tokens"] for s in called)
+            ratios[model] = cached / input_tokens if input_tokens else math.nan
+        return ratios
+
+    def log_summary(self):
+        for model, fields in self.summary().items():
+            for field, quantiles in fields.items():
+                logger.info("%s %s: %s", model, field, "  ".join(
+                    f"p{round(q * 100)}={v:.2f}" for q, v in quantiles.items()))
+        for model, ratio in self.prompt_cache_ratio().items():
+            logger.info("%s prompt cache: %.1f%% of input tokens cached", model, ratio * 100)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=FIELDS)
+            w.writeheader(); w.writerows(self.samples)
+
+    def export_prometheus(self, path):
+        lines = []
+        summary = self.summary()
+        groups = self.by_model()
+
+        for field in TIMED_FIELDS:
+            name = f"{PROM_PREFIX}_{field}_seconds"
+            lines.append(f"# HELP {name} Per-question {field.replace('_', ' ')}")
+            lines.append(f"# TYPE {name} summary")
+            for model, samples in groups.items():
+                called = [s[field] for s in samples if not s["cached"]]
+                for q, value in summary[model][field].items():
+                    lines.append(f'{name}{{model="{model}",quantile="{q}"}} {value}')
+                lines.append(f'{name}_sum{{model="{model}"}} {sum(called)}')
+                lines.append(f'{name}_count{{model="{model}"}} {len(called)}')
+
+        for field in COUNTED_FIELDS:
+            name = f"{PROM_PREFIX}_{field}_total"
+            lines.append(f"# HELP {name} Total {field.replace('_', ' ')}")
+            lines.append(f"# TYPE {name} counter")
+            for model, samples in groups.items():
+                lines.append(f'{name}{{model="{model}"}} {sum(s[field] for s in samples)}')
+
+        name = f"{PROM_PREFIX}_questions_total"
+        lines.append(f"# HELP {name} Answered questions")
+        lines.append(f"# TYPE {name} counter")
+        for model, samples in groups.items():
+            hits = sum(1 for s in samples if s["cached"])
+            lines.append(f'{name}{{model="{model}",cached="true"}} {hits}')
+            lines.append(f'{name}{{model="{model}",cached="false"}} {len(samples) - hits}')
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def export(self, path_prefix, fmt):
+        path = f"{path_prefix}_metrics.{'prom' if fmt == 'prom' else 'csv'}"
+        if fmt == "prom":
+            self.export_prometheus(path)
+        else:
+            self.export_csv(path)
+        logger.info("Wrote metrics for %d question(s) to %s", len(self.samples), path)
+        return path
@@ -0,0 +1,421 @@
+import argparse
+import glob
+import json
+import math
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import bundle
+import ledger
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+HOST         = "127.0.0.1"
+PORT         = 8765
+RESULT_FILES = "results/final/*.json"
+
+LATENCY          = "lognormal:2,0.5"  # see parse_latency
+TIME_SCALE       = 1.0   # multiplies every delay; 0.01 replays a run 100x faster
+ERROR_RATE       = 0.0   # share of requests answered with a 500
+RATE_LIMIT_RATE  = 0.0   # chance that a request starts a burst of 429s
+BURST_SIZE       = 5     # requests rejected per 429 burst
+RETRY_AFTER_MS   = 500
+STREAM_CHUNK     = 64    # characters per output_text.delta event
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "10000",
+    "x-ratelimit-remaining-requests": "9999",
+    "x-ratelimit-reset-requests": "6ms",
+    "x-ratelimit-limit-tokens": "100000000",
+    "x-ratelimit-remaining-tokens": "99999999",
+    "x-ratelimit-reset-tokens": "0s",
+}
+
+# -------------------------------------------------
+# Stored responses
+#
+# Each request is matched to a dataset question by its prompt text (in
+# either prompt layout) and answered with what the requested model said to
+# that question in the stored results. Another model's answer stands in
+# when the model has none, and a random stored answer when the prompt is
+# not a dataset question.
+# -------------------------------------------------
+
+def prompt_index():
+    # {cleaned prompt text: (paper, subject, num)}
+    index = {}
+    for paper, questions in bundle.load()["papers"].items():
+        for question in questions:
+            for prompt in question["prompts"].values():
+                text = bundle.IMAGE_RGX.sub('', prompt).strip()
+                index[text] = (paper, question["subject"], question["num"])
+    return index
+
+def load_answers(pattern=RESULT_FILES):
+    # {(paper, subject, num): {model: result record}}
+    answers = {}
+    for path in sorted(glob.glob(pattern)):
+        match = ledger.RUN_RGX.match(Path(path).stem)
+        if match is None or Path(path).stem.startswith(ledger.MOCK_PREFIX):
+            continue
+        paper, model = int(match.group(1)), match.group(2)
+        with open(path, "r", encoding="utf-8") as f:
+            for result in json.load(f):
+                answers.setdefault((paper, result["subject"], int(result["num"])), {})[model] = result
+    return answers
+
+def prompt_text(input):
+    # the user message's text, as the solver sends it
+    if isinstance(input, str):
+        return input
+    for message in input:
+        if message.get("role") != "user":
+            continue
+        content = message["content"]
+        if isinstance(content, str):
+            return content
+        return "".join(part.get("text", "") for part in content if part.get("type") == "input_text")
+    return ""
+
+def response_body(model, result, response_id):
+    usage = result.get("usage") or {}
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{response_id}",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": result["response"], "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": usage.get("input_tokens", 0),
+            "input_tokens_details": {"cached_tokens": usage.get("cached_input_tokens", 0)},
+            "output_tokens": usage.get("output_tokens", 0),
+            "output_tokens_details": {"reasoning_tokens": usage.get("reasoning_tokens", 0)},
+            "total_tokens": usage.get("total_tokens", 0),
+        },
+    }
+
+# -------------------------------------------------
+# Latency
+#
+#   const:S            always S seconds
+#   uniform:A,B        uniform between A and B seconds
+#   lognormal:M,SIGMA  log-normal with median M seconds
+#   tokens:TPS         the stored output token count at TPS tokens/sec
+# -------------------------------------------------
+
+def parse_latency(spec):
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "const":
+        return lambda result: values[0]
+    if kind == "uniform":
+        return lambda result: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda result: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "tokens":
+        return lambda result: (result.get("usage") or {}).get("output_tokens", 0) / values[0]
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+# -------------------------------------------------
+# Batches
+#
+# Enough of the Files and Batches APIs for `solver.py --batch`: uploaded
+# files are kept in memory, and a batch answers every request of its input
+# file as /responses would (faults included, as failed lines), then
+# completes once its slowest request would have finished.
+# -------------------------------------------------
+
+def multipart_fields(content_type, body):
+    # {name: (filename, bytes)} of a multipart/form-data body
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"content-type: {content_type}\r\n\r\n".encode("latin-1") + body)
+    return {part.get_param("name", header="content-disposition"):
+            (part.get_filename(), part.get_payload(decode=True))
+            for part in message.iter_parts()}
+
+def file_object(file_id, filename, data, purpose):
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(data),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+
+def batch_line(custom_id, status, body, error=None):
+    return json.dumps({
+        "id": f"batch_req_{custom_id}",
+        "custom_id": custom_id,
+        "response": {"status_code": status, "request_id": f"req_{custom_id}", "body": body},
+        "error": error,
+    })
+
+# -------------------------------------------------
+# Server
+# -------------------------------------------------
+
+class MockState:
+    def __init__(self, args):
+        self.index = prompt_index()
+        self.answers = load_answers(args.results)
+        self.latency = parse_latency(args.latency)
+        self.time_scale = args.time_scale
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.burst_size = args.burst_size
+        self.retry_after_ms = args.retry_after_ms
+        self.lock = threading.Lock()
+        self.burst_left = 0
+        self.served = 0
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "unmatched": 0, "batches": 0}
+        self.files = {}    # file id -> (file object, bytes)
+        self.batches = {}  # batch id -> batch object
+
+    def add_file(self, filename, data, purpose):
+        with self.lock:
+            file_id = f"file-mock{len(self.files) + 1}"
+            self.files[file_id] = (file_object(file_id, filename, data, purpose), data)
+        return self.files[file_id][0]
+
+    def create_batch(self, body):
+        with self.lock:
+            batch_id = f"batch_mock{len(self.batches) + 1}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body.get("endpoint"),
+                "input_file_id": body["input_file_id"],
+                "completion_window": body.get("completion_window", "24h"),
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+        self.count("batches")
+        threading.Thread(target=self.run_batch, args=(batch_id,), daemon=True).start()
+        return self.batches[batch_id]
+
+    def run_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        _, data = self.files[batch["input_file_id"]]
+        requests = [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(requests)
+        output, errors, delay = [], [], 0.0
+        for request in requests:
+            self.count("requests")
+            custom_id = request["custom_id"]
+            if self.fault():
+                self.count("errors")
+                errors.append(batch_line(custom_id, 500, {"error": {"message": "Internal error (mock)",
+                                                                    "type": "server_error"}}))
+                batch["request_counts"]["failed"] += 1
+                continue
+            body = request.get("body") or {}
+            response, result = self.answer(body.get("model", ""), body.get("input", []))
+            delay = max(delay, self.latency(result))
+            output.append(batch_line(custom_id, 200, response))
+            batch["request_counts"]["completed"] += 1
+            self.count("ok")
+        time.sleep(delay * self.time_scale)
+
+        if output:
+            batch["output_file_id"] = self.add_file(f"{batch_id}_output.jsonl",
+                                                    "\n".join(output).encode("utf-8") + b"\n", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self.add_file(f"{batch_id}_errors.jsonl",
+                                                   "\n".join(errors).encode("utf-8") + b"\n", "batch_output")["id"]
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def fault(self):
+        # None, 429 or 500 for the next request
+        with self.lock:
+            if self.burst_left == 0 and random.random() < self.rate_limit_rate:
+                self.burst_left = self.burst_size
+            if self.burst_left > 0:
+                self.burst_left -= 1
+                return 429
+        return 500 if random.random() < self.error_rate else None
+
+    def answer(self, model, input):
+        key = self.index.get(prompt_text(input).strip())
+        if key is None:
+            self.count("unmatched")
+            key = random.choice(list(self.answers))
+        by_model = self.answers.get(key) or self.answers[random.choice(list(self.answers))]
+        result = by_model.get(model) or next(iter(by_model.values()))
+        with self.lock:
+            self.served += 1
+            response_id = f"resp_mock_{self.served}"
+        return response_body(model, result, response_id), result
+
+# /v1/files/<id>, /v1/files/<id>/content and /v1/batches/<id>
+ROUTE_RGX = re.compile(r"/(files|batches)/([\w-]+)(/content)?$")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_bytes(self, status, data):
+        self.send_response(status)
+        self.send_header("content-type", "application/octet-stream")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self):
+        self.send_json(404, {"error": {"message": f"No route {self.path}"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        route = ROUTE_RGX.search(path)
+        kind, object_id, content = route.groups() if route else (None, None, None)
+        if path == "/stats":
+            self.send_json(200, self.state.counts)
+        elif kind == "batches" and object_id in self.state.batches and not content:
+            self.send_json(200, self.state.batches[object_id])
+        elif kind == "files" and object_id in self.state.files:
+            file, data = self.state.files[object_id]
+            if content:
+                self.send_bytes(200, data)
+            else:
+                self.send_json(200, file)
+        else:
+            self.not_found()
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("content-length", 0)))
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/files"):
+            fields = multipart_fields(self.headers["content-type"], data)
+            filename, content = fields["file"]
+            purpose = fields.get("purpose", (None, b"batch"))[1].decode("utf-8")
+            self.send_json(200, self.state.add_file(filename, content, purpose))
+            return
+        body = json.loads(data or b"{}")
+        if path.endswith("/batches"):
+            if body.get("input_file_id") not in self.state.files:
+                self.send_json(400, {"error": {"message": f"No file {body.get('input_file_id')}"}})
+                return
+            self.send_json(200, self.state.create_batch(body))
+            return
+        if not path.endswith("/responses"):
+            self.not_found()
+            return
+        state = self.state
+        state.count("requests")
+
+        fault = state.fault()
+        if fault == 429:
+            state.count("rate_limited")
+            self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                           {"retry-after-ms": str(state.retry_after_ms)})
+            return
+        if fault == 500:
+            state.count("errors")
+            self.send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            return
+
+        response, result = state.answer(body.get("model", ""), body.get("input", []))
+        delay = state.latency(result) * state.time_scale
+        if body.get("stream"):
+            self.stream(response, delay)
+        else:
+            time.sleep(delay)
+            self.send_json(200, response, RATE_LIMIT_HEADERS)
+        state.count("ok")
+
+    def stream(self, response, delay):
+        # the delay is spread over the text deltas, with the first one
+        # arriving after a tenth of it
+        text = response["output"][0]["content"][0]["text"]
+        chunks = [text[i:i + STREAM_CHUNK] for i in range(0, len(text), STREAM_CHUNK)] or [""]
+        events = [{"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}]
+        events += [{"type": "response.output_text.delta", "item_id": response["output"][0]["id"],
+                    "output_index": 0, "content_index": 0, "delta": chunk, "logprobs": []}
+                   for chunk in chunks]
+        events.append({"type": "response.completed", "response": response})
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("connection", "close")
+        for name, value in RATE_LIMIT_HEADERS.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(delay / 10)
+        gap = delay * 0.9 / len(chunks)
+        for seq, event in enumerate(events):
+            event["sequence_number"] = seq
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if event["type"] == "response.output_text.delta":
+                time.sleep(gap)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Responses API that replays stored answers")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--results", default=RESULT_FILES, help="glob of result files to replay")
+    parser.add_argument("--latency", default=LATENCY,
+                        help="const:S, uniform:A,B, lognormal:MEDIAN,SIGMA or tokens:TPS")
+    parser.add_argument("--time-scale", type=float, default=TIME_SCALE)
+    parser.add_argument("--error-rate", type=float, default=ERROR_RATE)
+    parser.add_argument("--rate-limit-rate", type=float, default=RATE_LIMIT_RATE)
+    parser.add_argument("--burst-size", type=int, default=BURST_SIZE)
+    parser.add_argument("--retry-after-ms", type=int, default=RETRY_AFTER_MS)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    Handler.state = MockState(args)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"Replaying {len(Handler.state.answers)} question(s) on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(Handler.state.counts))
+
+if __name__ == "__main__":
+    main()
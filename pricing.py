@@ -0,0 +1,155 @@
+import argparse
+import math
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import ledger
+
+# -------------------------------------------------
+# Price table
+#
+# USD per 1M tokens, one table per date the prices took effect. A run is
+# priced with the newest table in effect when it started. Reasoning tokens
+# are billed as output tokens; the Batch API halves every price.
+# -------------------------------------------------
+
+Price = namedtuple('Price', ['input', 'cached_input', 'output'])
+
+PRICE_TABLES = {
+    "2025-04-16": {
+        'o3':      Price(10.00, 2.50, 40.00),
+        'o4-mini': Price(1.10, 0.275, 4.40),
+        'gpt-4o':  Price(2.50, 1.25, 10.00),
+        'gpt-4.1': Price(2.00, 0.50, 8.00),
+    },
+    "2025-06-10": {
+        'o3':      Price(2.00, 0.50, 8.00),
+        'o4-mini': Price(1.10, 0.275, 4.40),
+        'gpt-4o':  Price(2.50, 1.25, 10.00),
+        'gpt-4.1': Price(2.00, 0.50, 8.00),
+    },
+}
+BATCH_DISCOUNT = 0.5
+
+COST_FIELDS = ["input_cost", "cached_input_cost", "output_cost", "reasoning_cost"]
+
+def price_version(when=None):
+    # newest table in effect at `when` (a datetime; default now)
+    day = (when or datetime.now()).strftime("%Y-%m-%d")
+    versions = sorted(v for v in PRICE_TABLES if v <= day)
+    return versions[-1] if versions else min(PRICE_TABLES)
+
+def price_for(model, version):
+    prices = PRICE_TABLES[version]
+    if model not in prices:
+        raise KeyError(f"No {version} prices for model {model}")
+    return prices[model]
+
+def usage_cost(usage, price, batch=False):
+    # {part: USD} for a usage dict with the solver's token counts.
+    # input_tokens includes the cached ones, output_tokens the reasoning ones.
+    # Without input or output counts (a run that recorded no usage) every
+    # part is NaN: the cost is unknown, not $0.
+    if usage.get('input_tokens') is None or usage.get('output_tokens') is None:
+        return dict.fromkeys(COST_FIELDS, math.nan)
+    scale = (BATCH_DISCOUNT if batch else 1) / 1e6
+    cached = usage.get('cached_input_tokens') or 0
+    reasoning = usage.get('reasoning_tokens') or 0
+    return {
+        "input_cost": (usage['input_tokens'] - cached) * price.input * scale,
+        "cached_input_cost": cached * price.cached_input * scale,
+        "output_cost": (usage['output_tokens'] - reasoning) * price.output * scale,
+        "reasoning_cost": reasoning * price.output * scale,
+    }
+
+def run_version(run):
+    return price_version(datetime.fromtimestamp(run['started']) if run['started'] else None)
+
+def priced_usage(usage, run, version=None):
+    # cost parts, total and price table for a run's summed usage; `run`
+    # needs model, batch and started, as in the ledger's runs table
+    version = version or run_version(run)
+    cost = usage_cost(usage, price_for(run['model'], version), run['batch'])
+    cost["total_cost"] = sum(cost.values())
+    cost["price_version"] = version
+    return cost
+
+def run_cost(conn, name, version=None):
+    return priced_usage(ledger.run_usage(conn, name), ledger.run_info(conn, name), version)
+
+# -------------------------------------------------
+# Cost per mark
+# -------------------------------------------------
+
+def cost_table(conn, names=None, version=None):
+    # one row per run: cost parts, score and cost per mark/correct answer
+    import evaluator  # evaluator imports pricing for its sample curve
+    names = names or [row['name'] for row in ledger.runs(conn)]
+    costs = pd.DataFrame([{"file": name, **run_cost(conn, name, version)} for name in names])
+    scores = evaluator.score_table(evaluator.load_ledger(names, conn=conn))
+    marks = scores.groupby('file').agg(model=('model', 'first'), paper=('paper', 'first'),
+                                       score=('score', 'sum'), max_score=('max_score', 'sum'),
+                                       correct=('correct', 'sum'))
+    table = marks.join(costs.set_index('file')).reset_index().rename(columns={'file': 'run'})
+    table['cost_per_mark'] = table['total_cost'] / table['score'].where(table['score'] > 0)
+    table['cost_per_correct'] = table['total_cost'] / table['correct'].where(table['correct'] > 0)
+    return table
+
+def unpriced(table):
+    # runs whose cost is unknown because they have no usage records
+    return table.loc[table['total_cost'].isna(), 'run'].tolist()
+
+def by_model(table):
+    # runs of a model summed over papers (and repeats), cheapest first;
+    # runs of unknown cost are left out, so they cannot make a model look cheap
+    table = table[table['total_cost'].notna()]
+    summary = table.groupby('model')[['score', 'max_score', 'correct', 'total_cost']].sum()
+    summary['accuracy'] = summary['score'] / summary['max_score']
+    summary['cost_per_mark'] = summary['total_cost'] / summary['score'].where(summary['score'] > 0)
+    summary['cost_per_correct'] = summary['total_cost'] / summary['correct'].where(summary['correct'] > 0)
+    return summary.sort_values('total_cost')
+
+def cheapest(summary, target):
+    # cheapest model whose share of the maximum marks is at least `target`
+    meeting = summary[summary['accuracy'] >= target]
+    return None if meeting.empty else meeting['total_cost'].idxmin()
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of runs, per mark and per correct answer")
+    parser.add_argument('runs', nargs='*',
+                        help="run names or result files (default: every run in the ledger)")
+    parser.add_argument('--prices', choices=sorted(PRICE_TABLES),
+                        help="price table to use (default: the one in effect when each run started)")
+    parser.add_argument('--target', type=float,
+                        help="pick the cheapest model scoring at least this share of the marks")
+    args = parser.parse_args()
+
+    conn = ledger.connect()
+    names = [Path(run).stem for run in args.runs]
+    missing = [name for name in names if ledger.run_info(conn, name) is None]
+    if missing:
+        parser.error(f"not in the ledger: {', '.join(missing)} (add them with `python ledger.py import`)")
+
+    table = cost_table(conn, names, args.prices)
+    with pd.option_context('display.width', 160, 'display.max_rows', None):
+        print(table[['run', 'score', 'correct', 'price_version'] + COST_FIELDS +
+                    ['total_cost', 'cost_per_mark', 'cost_per_correct']].round(4).to_string(index=False))
+        print("")
+        summary = by_model(table)
+        print(summary.round(4).to_string())
+    if unpriced(table):
+        print(f"\nNo usage recorded, left out of the model totals: {', '.join(unpriced(table))}")
+
+    if args.target is not None:
+        model = cheapest(summary, args.target)
+        if model is None:
+            print(f"\nNo model reaches {args.target:.0%} of the marks")
+        else:
+            print(f"\nCheapest model at {args.target:.0%} of the marks: {model} "
+                  f"(${summary.loc[model, 'total_cost']:.4f})")
+
+if __name__ == "__main__":
+    main()
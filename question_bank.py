@@ -0,0 +1,228 @@
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+BANK_FILE = "dataset/questions.db"
+DATA_DIR  = "dataset"
+PAGE_SIZE = 20
+
+# every dataset CSV has these columns; `num` and `subject` identify a question
+FIELDS = ["ans", "diagram", "num", "optA", "optB", "optC", "optD", "subject", "text", "type"]
+EDITABLE = [f for f in FIELDS if f not in ("num", "subject")]
+
+# -------------------------------------------------
+# Schema
+#
+# The annotator's working copy of the dataset. Each save is one UPDATE of
+# one row, so it costs the same whatever the size of the bank, and SQLite
+# keeps concurrent annotators from overwriting half a file. The CSVs stay
+# the dataset everything else reads; `export` writes a paper back out.
+#
+# papers     one row per imported paper: the CSV it came from, its stat at
+#            the last import/export, and a revision that every save bumps
+#            (the ETag of the paper's pages)
+# questions  one row per question, in CSV order (`position`); `version`
+#            counts the saves of the row, so a save made from a stale copy
+#            can be refused
+# -------------------------------------------------
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    paper    INTEGER PRIMARY KEY,
+    source   TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size     INTEGER,
+    revision INTEGER NOT NULL DEFAULT 0,
+    exported INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS questions (
+    paper    INTEGER NOT NULL REFERENCES papers (paper),
+    position INTEGER NOT NULL,
+    num      INTEGER NOT NULL,
+    subject  TEXT NOT NULL,
+    type     TEXT NOT NULL,
+    text     TEXT NOT NULL DEFAULT '',
+    optA     TEXT NOT NULL DEFAULT '',
+    optB     TEXT NOT NULL DEFAULT '',
+    optC     TEXT NOT NULL DEFAULT '',
+    optD     TEXT NOT NULL DEFAULT '',
+    ans      TEXT NOT NULL DEFAULT '',
+    diagram  TEXT NOT NULL DEFAULT '',
+    version  INTEGER NOT NULL DEFAULT 0,
+    updated  REAL,
+    PRIMARY KEY (paper, position)
+);
+"""
+
+def connect(path=BANK_FILE):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # saves from other annotators wait up to `timeout` for the write lock
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def data_file(paper, data_dir=DATA_DIR):
+    return f"{data_dir}/jeea25_p{paper}.csv"
+
+def stat_of(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+# -------------------------------------------------
+# Import / export
+# -------------------------------------------------
+
+def paper_info(conn, paper):
+    return conn.execute("SELECT * FROM papers WHERE paper = ?", (paper,)).fetchone()
+
+def pending(conn, paper):
+    # saves not yet exported to the CSV
+    info = paper_info(conn, paper)
+    return info["revision"] - info["exported"] if info else 0
+
+def import_csv(conn, paper, data_dir=DATA_DIR):
+    # (Re)loads a paper from its CSV. Refuses to drop saves that were never
+    # exported.
+    path = data_file(paper, data_dir)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        unknown = set(reader.fieldnames) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"{path}: unexpected column(s) {sorted(unknown)}")
+        rows = [(paper, position, int(row["num"]), row["subject"]) + tuple(row.get(f) or "" for f in EDITABLE)
+                for position, row in enumerate(reader)]
+    if pending(conn, paper):
+        raise RuntimeError(f"Paper {paper} has {pending(conn, paper)} unexported save(s); export them first")
+
+    mtime_ns, size = stat_of(path)
+    with conn:
+        conn.execute("DELETE FROM questions WHERE paper = ?", (paper,))
+        conn.execute(
+            "INSERT INTO papers (paper, source, mtime_ns, size) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (paper) DO UPDATE SET source = excluded.source, mtime_ns = excluded.mtime_ns, "
+            "size = excluded.size, revision = revision + 1, exported = revision + 1",
+            (paper, path, mtime_ns, size))
+        conn.executemany(
+            f"INSERT INTO questions (paper, position, num, subject, {', '.join(EDITABLE)}) "
+            f"VALUES ({', '.join('?' * (4 + len(EDITABLE)))})", rows)
+    return len(rows)
+
+def ensure_paper(conn, paper, data_dir=DATA_DIR):
+    # Imports the paper on first use, and again when its CSV was edited by
+    # hand since (as long as the bank has nothing unexported).
+    info = paper_info(conn, paper)
+    if info is None:
+        return import_csv(conn, paper, data_dir)
+    if (info["mtime_ns"], info["size"]) != stat_of(info["source"]):
+        if not pending(conn, paper):
+            return import_csv(conn, paper, data_dir)
+        logger.warning("%s changed since paper %d was imported, but the bank has unexported saves; "
+                       "keeping the bank", info["source"], paper)
+    return 0
+
+def export(conn, paper, path=None):
+    # Writes the paper back to its CSV (atomically, via a temporary file).
+    info = paper_info(conn, paper)
+    path = path or info["source"]
+    rows = conn.execute(f"SELECT {', '.join(FIELDS)} FROM questions WHERE paper = ? ORDER BY position",
+                        (paper,)).fetchall()
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS)
+        w.writeheader()
+        w.writerows(dict(row) for row in rows)
+    os.replace(tmp_file, path)
+    if path == info["source"]:
+        mtime_ns, size = stat_of(path)
+        with conn:
+            conn.execute("UPDATE papers SET mtime_ns = ?, size = ?, exported = ? WHERE paper = ?",
+                         (mtime_ns, size, info["revision"], paper))
+    return len(rows)
+
+# -------------------------------------------------
+# Reading and saving
+# -------------------------------------------------
+
+def revision(conn, paper):
+    return paper_info(conn, paper)["revision"]
+
+def count(conn, paper):
+    return conn.execute("SELECT count(*) FROM questions WHERE paper = ?", (paper,)).fetchone()[0]
+
+def outline(conn, paper):
+    # what the question picker needs, without the question text
+    return conn.execute("SELECT position, num, subject, type FROM questions WHERE paper = ? ORDER BY position",
+                        (paper,)).fetchall()
+
+def page(conn, paper, offset=0, limit=PAGE_SIZE):
+    return conn.execute(
+        f"SELECT position, {', '.join(FIELDS)}, version FROM questions "
+        "WHERE paper = ? AND position >= ? ORDER BY position LIMIT ?", (paper, offset, limit)).fetchall()
+
+def update(conn, paper, position, fields, version=None):
+    # Saves the given fields of one question. With `version`, the save only
+    # goes through if nobody saved the question since that version was
+    # read. Returns the new version, or None if the question does not exist
+    # or the version is stale. A save with nothing to change writes nothing,
+    # so it does not bump the version and revision other annotators hold.
+    fields = {f: v for f, v in fields.items() if f in EDITABLE}
+    if not fields:
+        row = conn.execute("SELECT version FROM questions WHERE paper = ? AND position = ?",
+                           (paper, position)).fetchone()
+        if row is None or (version is not None and row["version"] != version):
+            return None
+        return row["version"]
+    assignments = "".join(f"{f} = :{f}, " for f in fields)
+    check = " AND version = :version" if version is not None else ""
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE questions SET {assignments}version = version + 1, updated = :updated "
+            f"WHERE paper = :paper AND position = :position{check} RETURNING version",
+            {**fields, "paper": paper, "position": position, "version": version, "updated": time.time()})
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return None
+        conn.execute("UPDATE papers SET revision = revision + 1 WHERE paper = ?", (paper,))
+    return row["version"]
+
+def main():
+    parser = argparse.ArgumentParser(description="The annotator's question bank: import papers from and export them to the CSVs")
+    parser.add_argument("--db", default=BANK_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="(re)load papers from their CSVs")
+    importer.add_argument("papers", nargs="+", type=int)
+    exporter = commands.add_parser("export", help="write papers back to their CSVs")
+    exporter.add_argument("papers", nargs="+", type=int)
+    commands.add_parser("status", help="list papers with their unexported saves")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "import":
+        for paper in args.papers:
+            print(f"Imported {import_csv(conn, paper)} question(s) of paper {paper}")
+    elif args.command == "export":
+        for paper in args.papers:
+            if paper_info(conn, paper) is None:
+                raise RuntimeError(f"Paper {paper} is not in {args.db}")
+            print(f"Exported {export(conn, paper)} question(s) to {data_file(paper)}")
+    elif args.command == "status":
+        for info in conn.execute("SELECT paper, source FROM papers ORDER BY paper"):
+            print(f"Paper {info['paper']}: {count(conn, info['paper'])} question(s), "
+                  f"{pending(conn, info['paper'])} unexported save(s) ({info['source']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import answer_key
+import answers
+import archive
+import ledger
+import vote
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+RESULT_FILES = "results/final/*.json"
+WORKERS      = os.cpu_count() or 1
+
+# -------------------------------------------------
+# Re-processing
+#
+# Every record of a stored result file gets its prediction re-extracted from
+# its response text (each sample's, then re-voted, for sampled runs) and its
+# answer re-joined from the current dataset. Where the extractor finds no
+# answer the stored prediction stays, as it may have been patched by hand.
+# Nothing is written without --write; then a file is only rewritten when a
+# record in it changed, and the ledger (with --ledger) only has the changed
+# rows updated. Files are independent, so they are spread over a process
+# pool; each worker returns its file's changes and score before and after.
+# .jra archives are read and rewritten as archives, keeping their JSON
+# layout.
+# -------------------------------------------------
+
+def run_paper(path):
+    match = ledger.RUN_RGX.match(Path(path).stem)
+    return int(match.group(1)) if match else None
+
+def reextract(record):
+    # the prediction the current extractor gives for a record, or the stored
+    # one where it finds none
+    if record.get("samples"):
+        preds = [answers.extract(s.get("response"), record["type"]) or s.get("pred") for s in record["samples"]]
+        return vote.vote(record["type"], preds)[0], preds
+    return answers.extract(record.get("response"), record["type"]) or record["pred"], None
+
+def record_score(record):
+    return answer_key.score(answer_key.parse_answer(record["type"], record["ans"]), record["pred"])
+
+def process_file(path, preds=True, keys=True, write=False):
+    results = archive.load(path)
+    paper = run_paper(path)
+    index = answer_key.load_index(paper) if keys and paper is not None else {}
+
+    changes = []
+    before = {}
+    after = {}
+    for record in results:
+        old = {"pred": record["pred"], "ans": record["ans"]}
+        old_score = record_score(record)
+        if preds:
+            record["pred"], sample_preds = reextract(record)
+            if sample_preds is not None:
+                for sample, pred in zip(record["samples"], sample_preds):
+                    sample["pred"] = pred
+        answer = index.get((record["subject"], int(record["num"])))
+        if answer is not None:
+            record["ans"] = answer.text
+        new_score = record_score(record)
+
+        subject = record["subject"]
+        before[subject] = before.get(subject, 0) + old_score
+        after[subject] = after.get(subject, 0) + new_score
+        fields = [f for f in ("pred", "ans") if record[f] != old[f]]
+        if fields:
+            changes.append({
+                "subject": subject,
+                "num": record["num"],
+                **{f"old_{f}": old[f] for f in fields},
+                **{f"new_{f}": record[f] for f in fields},
+                "old_score": old_score,
+                "new_score": new_score,
+            })
+
+    if changes and write and archive.is_archive(path):
+        with archive.Archive(path) as result_archive:
+            layout = result_archive.header["json"]
+        archive.write(results, path, layout)
+    elif changes and write:
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, path)
+
+    return {
+        "file": str(path),
+        "run": Path(path).stem,
+        "paper": paper,
+        "records": len(results),
+        "changes": changes,
+        "before": before,
+        "after": after,
+    }
+
+def update_ledger(conn, reports, keys=True):
+    # Changed predictions of runs already in the ledger, row by row; with
+    # `keys`, the papers with a changed answer are re-keyed from the dataset
+    # as a whole.
+    known = {row["name"] for row in ledger.runs(conn)}
+    rows = [(c["new_pred"], report["run"], c["subject"], int(c["num"]))
+            for report in reports if report["run"] in known
+            for c in report["changes"] if "new_pred" in c]
+    with conn:
+        conn.executemany("UPDATE responses SET pred = ? WHERE run = ? AND subject = ? AND num = ?", rows)
+    papers = {r["paper"] for r in reports
+              if r["paper"] is not None and any("new_ans" in c for c in r["changes"])}
+    rekeyed = sum(ledger.rekey(conn, paper) for paper in sorted(papers)) if keys else 0
+    return len(rows), rekeyed
+
+# -------------------------------------------------
+# Report
+# -------------------------------------------------
+
+def print_report(reports, verbose=False):
+    changed = [r for r in reports if r["changes"]]
+    width = max((len(r["run"]) for r in changed), default=0)
+    for report in changed:
+        old, new = sum(report["before"].values()), sum(report["after"].values())
+        subjects = ", ".join(f"{s} {report['after'][s] - report['before'][s]:+d}"
+                             for s in report["before"] if report["after"][s] != report["before"][s])
+        print(f"{report['run']:<{width}}  {len(report['changes']):>3} changed  "
+              f"{old:>4} -> {new:>4} ({new - old:+d}){'  ' + subjects if subjects else ''}")
+        if verbose:
+            for c in report["changes"]:
+                fields = "  ".join(f"{f} {c['old_' + f]!r} -> {c['new_' + f]!r}"
+                                   for f in ("pred", "ans") if "new_" + f in c)
+                print(f"    {c['subject']:<9} Q{c['num']:<3} {fields}  "
+                      f"score {c['old_score']} -> {c['new_score']}")
+
+    records = sum(r["records"] for r in reports)
+    changes = sum(len(r["changes"]) for r in reports)
+    delta = sum(sum(r["after"].values()) - sum(r["before"].values()) for r in reports)
+    print(f"{len(reports)} file(s), {records} record(s): {changes} changed in {len(changed)} file(s), "
+          f"score {delta:+d} in total")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-extract predictions and re-join answer keys for stored runs")
+    parser.add_argument("result_files", nargs="*", help=f"result files (default: {RESULT_FILES})")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--keep-preds", action="store_true", help="only re-join the answer keys")
+    parser.add_argument("--keep-keys", action="store_true", help="only re-extract the predictions")
+    parser.add_argument("--write", action="store_true",
+                        help="rewrite the changed result files in place (default: only report the changes)")
+    parser.add_argument("--ledger", nargs="?", const=ledger.LEDGER_FILE, metavar="DB",
+                        help="with --write, also update the changed rows in the run ledger")
+    parser.add_argument("--report", help="write the changes as JSON to this file")
+    parser.add_argument("--verbose", "-v", action="store_true", help="list every changed record")
+    args = parser.parse_args()
+
+    paths = sorted(args.result_files or glob.glob(RESULT_FILES))
+    if not paths:
+        raise RuntimeError("No result files to re-process")
+
+    # compile the answer keys once here, so the workers only read the index
+    if not args.keep_keys:
+        for paper in {run_paper(p) for p in paths} - {None}:
+            answer_key.load_index(paper)
+
+    if args.ledger and not args.write:
+        parser.error("--ledger needs --write")
+
+    process = partial(process_file, preds=not args.keep_preds, keys=not args.keep_keys, write=args.write)
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(paths))) as executor:
+        reports = list(executor.map(process, paths))
+
+    print_report(reports, args.verbose)
+    if not args.write:
+        print("Nothing written; --write rewrites the changed files")
+    if args.ledger:
+        updated, rekeyed = update_ledger(ledger.connect(args.ledger), reports, keys=not args.keep_keys)
+        print(f"Ledger: {updated} prediction(s) updated, {rekeyed} answer(s) re-keyed")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+# Starting (requests/min, tokens/min) budgets per model. These are only the
+# initial guess: the x-ratelimit-* headers on every response replace them
+# with the account's real limits.
+RATE_LIMITS = {
+    'o3':      (500, 30_000),
+    'o4-mini': (1_000, 100_000),
+    'gpt-4o':  (500, 30_000),
+    'gpt-4.1': (500, 30_000),
+}
+DEFAULT_RATE_LIMIT = (500, 30_000)
+
+MAX_RETRIES   = 6     # attempts per submission before the question is re-queued
+MAX_REQUEUES  = 2     # times a question goes back on the queue before giving up
+BACKOFF_BASE  = 1.0   # seconds
+BACKOFF_MAX   = 60.0  # seconds
+
+CHARS_PER_TOKEN        = 4
+IMAGE_TOKEN_ESTIMATE   = 765
+OUTPUT_TOKEN_ESTIMATE  = 4_000  # prior for output tokens until real usage comes in
+
+# -------------------------------------------------
+# Token buckets
+# -------------------------------------------------
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        self._refill()
+        # a single request larger than the whole bucket still has to go through
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def set_limit(self, per_minute):
+        self._refill()
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = min(self.level, per_minute)
+
+    def sync(self, remaining, reset_seconds):
+        # The server only ever knows about more usage than we do (other
+        # clients on the same key), so it can lower our level but not raise it.
+        self._refill()
+        self.level = min(self.level, remaining)
+        if reset_seconds:
+            self.rate = max(self.rate, (self.capacity - remaining) / reset_seconds)
+
+DURATION_RGX = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+def parse_duration(value):
+    # x-ratelimit-reset-* values look like "1s", "6m0s" or "20ms"
+    if not value:
+        return None
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in DURATION_RGX.findall(value))
+
+class RateLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0
+        self.output_tokens = OUTPUT_TOKEN_ESTIMATE
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        # Requests are admitted one at a time so a large request is not
+        # starved by a stream of small ones.
+        async with self.lock:
+            while True:
+                delay = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def reconcile(self, estimated, actual, output_tokens):
+        self.tokens.consume(actual - estimated)
+        # moving average of output size, used for the next estimates
+        self.output_tokens = 0.8 * self.output_tokens + 0.2 * output_tokens
+
+    def update_from_headers(self, headers):
+        for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if limit:
+                bucket.set_limit(int(limit))
+            if remaining:
+                bucket.sync(int(remaining), reset)
+
+limiters = {}
+
+def limiter_for(model):
+    if model not in limiters:
+        limiters[model] = RateLimiter(*RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT))
+    return limiters[model]
+
+# -------------------------------------------------
+# Retries
+# -------------------------------------------------
+
+class StreamError(openai.APIError):
+    # a stream that ended without a completed response
+    pass
+
+def is_retryable(e):
+    if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, StreamError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+def retry_after(e):
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    if headers.get('retry-after-ms'):
+        return float(headers['retry-after-ms']) / 1000
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+
+def backoff_delay(attempt):
+    cap = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return cap / 2 + random.uniform(0, cap / 2)
+
+def estimate_tokens(model, input):
+    tokens = 0
+    for message in input:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += len(content) // CHARS_PER_TOKEN
+            continue
+        for part in content:
+            if part["type"] == "input_image":
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                tokens += len(part["text"]) // CHARS_PER_TOKEN
+    return tokens + int(limiter_for(model).output_tokens)
+
+# Creates a response under the model's rate limits, retrying 429s and 5xx
+# errors. The last error is raised once retries run out. With a
+# stream_handler the response is streamed: the handler is awaited with the
+# event stream and the time the request was sent, and returns the final
+# response. A stats dict, if given, gets the retry count, the time spent
+# waiting on the rate limiter (limit_wait, over all attempts) and the
+# latency of the call that succeeded. params are extra arguments for responses.create.
+async def submit(client, model, input, stream_handler=None, stats=None, params=None):
+    stats = {} if stats is None else stats
+    params = params or {}
+    limiter = limiter_for(model)
+    estimated = estimate_tokens(model, input)
+    stream = stream_handler is not None
+    for attempt in range(MAX_RETRIES + 1):
+        waiting = time.monotonic()
+        await limiter.acquire(estimated)
+        stats["limit_wait"] = stats.get("limit_wait", 0) + time.monotonic() - waiting
+        try:
+            started = time.monotonic()
+            raw = await client.responses.with_raw_response.create(model=model, input=input, stream=stream, **params)
+            if stream:
+                response = await stream_handler(raw.parse(), started)
+            else:
+                response = raw.parse()
+        except openai.APIError as e:
+            if not is_retryable(e) or attempt == MAX_RETRIES:
+                raise
+            delay = retry_after(e) or backoff_delay(attempt)
+            if isinstance(e, openai.RateLimitError):
+                # everyone on this model backs off, not just this request
+                limiter.pause(delay)
+            stats["retries"] = stats.get("retries", 0) + 1
+            logger.warning("Retrying %s in %.1fs (attempt %d/%d): %s",
+                           model, delay, attempt + 1, MAX_RETRIES, e)
+            await asyncio.sleep(delay)
+            continue
+
+        stats["latency"] = time.monotonic() - started
+        limiter.update_from_headers(raw.headers)
+        limiter.reconcile(estimated, response.usage.total_tokens, response.usage.output_tokens)
+        return response
@@ -1,16 +1,30 @@
-from openai import OpenAI
-import pandas as pd
+from openai import OpenAI, AsyncOpenAI
 from pathlib import Path
 import pickle
 import re
-from jinja2 import Environment, FileSystemLoader
 from dotenv import dotenv_values
-from time import sleep
 import sys
 from datetime import datetime
 import logging
 import json
+import argparse
 import base64
+import asyncio
+import scheduler
+import journal
+import batch
+import metrics
+import vote
+import cache
+import images
+import ledger
+import bundle
+import answers
+import functools
+import os
+import contextlib
+import threading
+import time
 
 # -------------------------------------------------
 # Configuration
@@ -24,12 +38,29 @@ PROMPT_DIR = "prompts"
 LOG_DIR    = "logs"
 LOG_LEVEL  = logging.DEBUG if DEBUG else logging.INFO
 MODEL_NAME = "o3"
-SLEEP      = 5
+CONCURRENCY = 8  # max requests in flight; 1 runs questions one at a time
+USE_CACHE  = True  # re-use responses for requests that were already answered
+USE_LEDGER = True  # also record runs and answers in the run ledger (ledger.py)
+MOCK       = False  # answers come from mock_server.py; set by --mock
+# send the images' optimized variants (images.py) instead of the dataset's;
+# this changes the inputs, so such runs are not comparable with published ones
+OPTIMIZED_IMAGES = False
+API_BASE_URL = None  # None for api.openai.com; set by --base-url / --mock
+MOCK_URL   = "http://127.0.0.1:8765/v1"  # where mock_server.py listens by default
+BATCH_POLL = batch.POLL_INTERVAL  # seconds between batch status checks
+# "inline" puts the marking scheme in the user message before the question,
+# as in the published runs. "prefix" moves system.txt and the schemes of all
+# question types into one developer message that is the same for every
+# question, so OpenAI's prompt cache can serve it (it only caches prefixes of
+# 1024+ tokens, more than any one scheme).
+PROMPT_LAYOUT = "inline"
+PROMPT_LAYOUTS = ["inline", "prefix"]
 
-DATA_FILE   = f"{DATA_DIR}/jeea25_p{PAPER_NUM}.csv"
 IMAGE_DIR   = f"{DATA_DIR}/images"
-OUTPUT_FILE = f"{RESULT_DIR}/{'DEBUG_' if DEBUG else ''}jeea25_p{PAPER_NUM}_{MODEL_NAME}_{RUN_TIME}.json"
-LOG_FILE    = f"{LOG_DIR}/{'DEBUG_' if DEBUG else ''}jeea25_p{PAPER_NUM}_{MODEL_NAME}_{RUN_TIME}.log"
+
+# A run is named jeea25_p<paper>_<model>_<time>, with a -<n> suffix for the
+# nth repeat of a sweep (see ledger.RUN_RGX); its journal, result file and
+# log all share that name, so a broken run can be picked up again by name.
 
 QUESTION_TYPES = ["SCA", "MCA", "NT", "M"]
 
@@ -56,39 +87,62 @@ def setup_logger(logfile, level):
 
     return logger
 
-logger = setup_logger(LOG_FILE, LOG_LEVEL)
-
-client = OpenAI(api_key=dotenv_values()['OPENAI_API_KEY'])
-
-env = Environment(loader=FileSystemLoader("prompts"))
-
-with open(f"{PROMPT_DIR}/system.txt", "r") as f:
-    system_prompt = f.read().strip()
-
-templates = {
-    tmp : env.get_template(f"{tmp.lower()}.j2") for tmp in QUESTION_TYPES
-}
+def run_name(paper, model, run_time=RUN_TIME, repeat=None):
+    suffix = f"-{repeat}" if repeat else ""
+    prefix = ledger.MOCK_PREFIX if MOCK else "DEBUG_" if DEBUG else ""
+    return f"{prefix}jeea25_p{paper}_{model}_{run_time}{suffix}"
+
+def parse_run_name(name):
+    # returns (paper, model, sample); repeat n of a sweep is sample n-1
+    match = ledger.RUN_RGX.match(Path(name).stem)
+    if match is None:
+        raise ValueError(f"Not a run name: {name}")
+    repeat = int(match.group(4) or 1)
+    return int(match.group(1)), match.group(2), repeat - 1
+
+def data_file(paper):
+    return f"{DATA_DIR}/jeea25_p{paper}.csv"
+
+logger = logging.getLogger()
+
+@functools.cache
+def openai_clients():
+    # (sync, async) clients, made on first use so dry runs need no API key
+    api_key = dotenv_values().get('OPENAI_API_KEY')
+    if api_key is None and API_BASE_URL:
+        api_key = "mock"  # local servers don't check it
+    # retries are handled by the scheduler, which also knows about rate limits
+    return (OpenAI(api_key=api_key, base_url=API_BASE_URL),
+            AsyncOpenAI(api_key=api_key, base_url=API_BASE_URL, max_retries=0))
+
+def use_api(base_url=None, mock=False):
+    # Points the clients at another server. Answers from mock_server.py are
+    # replays, so they stay out of the response cache and the run ledger,
+    # and their runs are named MOCK_... so their files are never taken for
+    # real runs.
+    global API_BASE_URL, USE_CACHE, USE_LEDGER, BATCH_POLL, MOCK
+    API_BASE_URL = MOCK_URL if mock and not base_url else base_url
+    if mock:
+        MOCK = True
+        USE_CACHE = False
+        USE_LEDGER = False
+        BATCH_POLL = 1  # mock batches finish in seconds
+
+@functools.cache
+def prompt_bundle():
+    # every question pre-rendered by bundle.py; rebuilt if the dataset changed
+    return bundle.load(data_dir=DATA_DIR, prompt_dir=PROMPT_DIR)
 
 # -------------------------------------------------
 # Logic
 # -------------------------------------------------
-def create_prompt(row):
+def create_prompt(row, layout=PROMPT_LAYOUT):
     logger.debug("Creating prompt for question %s", row["text"])
-    qtype = row["type"]
-    template = templates[qtype]
-    context = {
-        "question": row["text"],
-    }
-    if qtype != "NT":
-        context["options"] = [row["optA"], row["optB"], row["optC"], row["optD"]]
-
-    return template.render(context)
+    return row["prompts"][layout]
 
-FINAL_ANSWER_RGX = re.compile(r"\\boxed{\s*([ABCDO\d,.-]+)\s*}")
-
-def extract_final_answer(text):
-    match = FINAL_ANSWER_RGX.search(text)
-    return match.group(1) if match else None
+def extract_final_answer(text, qtype=None):
+    # the last boxed answer, normalized for the question type; see answers.py
+    return answers.extract(text, qtype)
 
 IMAGE_RGX = re.compile(r'!\[.*?\]\((.*?)\)')
 
@@ -102,6 +156,27 @@ def b64_encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
+@functools.cache
+def image_store():
+    # encoded once by `python images.py`; falls back to reading from disk
+    return images.ImageStore(optimized=OPTIMIZED_IMAGES)
+
+def use_optimized_images(optimized=True):
+    global OPTIMIZED_IMAGES
+    OPTIMIZED_IMAGES = optimized
+    image_store.cache_clear()
+
+@functools.cache
+def ledger_db():
+    # answers are recorded from worker threads (see solve), one at a time
+    return ledger.connect(check_same_thread=False)
+
+ledger_lock = threading.Lock()
+
+def record_answer(run, result):
+    with ledger_lock:
+        ledger.record(ledger_db(), run, result)
+
 def prompt_to_multimodal_content(prompt):
     content = []
 
@@ -114,73 +189,480 @@ def prompt_to_multimodal_content(prompt):
 
     # Add all images in sequence
     for path in image_paths:
-        full_path = Path(DATA_DIR) / path
         content.append({
             "type": "input_image",
-            "image_url": f"data:image/png;base64,{b64_encode_image(full_path)}"
+            "image_url": image_store().data_url(path)
         })
 
     return content
 
 
-def call_openai(prompt, model=MODEL_NAME):
-    logger.info("Calling OpenAI model %s", model)
+def build_input(prompt, model, layout=PROMPT_LAYOUT):
     input = []
-    if model == 'gpt-4o' or model == 'gpt-4.1':
+    if layout == "prefix":
+        input.append({
+            "role": "developer",
+            "content": prompt_bundle()["prefix_prompt"]
+        })
+    elif model == 'gpt-4o' or model == 'gpt-4.1':
         # not reasoning model - add system prompt
         input.append({
             "role": "developer",
-            "content": system_prompt
+            "content": prompt_bundle()["system_prompt"]
         })
     input.append({
         "role": "user",
         "content": prompt_to_multimodal_content(prompt)
     })
-    try:
-        response = client.responses.create(model=model, input=input)
-        return response
-    except Exception as e:
-        print(f"Error calling OpenAI API: {e}")
-        return None
-
-def main():
-    df = pd.read_csv(DATA_FILE)
-
-    results = []
-
-    for idx, row in df.iterrows():
-        prompt = create_prompt(row)
-        response = call_openai(prompt)
-        final_ans = extract_final_answer(response.output_text)
-
-        logger.info("Got final answer %s for question %d", final_ans, idx+1)
-
-        results.append({
-            "num": row["num"],
-            "subject": row["subject"],
-            "type": row["type"],
-            "ans": row["ans"],
-            "pred": final_ans,
-            "response": response.output_text,
-            "usage": {
-                "input_tokens": response.usage.input_tokens,
-                "cached_input_tokens": response.usage.input_tokens_details.cached_tokens,
-                "output_tokens": response.usage.output_tokens,
-                "reasoning_tokens": response.usage.output_tokens_details.reasoning_tokens,
-                "total_tokens": response.usage.total_tokens
-            }
-        })
+    return input
+
+async def read_stream(stream, started, timing, qtype=None):
+    # Consumes a Responses event stream, noting when the first answer token
+    # arrives and when the last boxed answer shows up in the text. Only a
+    # short tail of the text is kept; the full text is on the response.
+    scanner = answers.AnswerScanner(qtype)
+    first = True
+    response = None
+    async for event in stream:
+        if event.type == "response.output_text.delta":
+            now = time.monotonic()
+            if first:
+                timing["ttft"] = round(now - started, 3)
+                first = False
+            pred = scanner.feed(event.delta)
+            if pred is not None:
+                if "answer_at" not in timing:
+                    logger.info("Answer %s seen in stream after %.1fs", pred, now - started)
+                timing["answer_at"] = round(now - started, 3)
+        elif event.type in ("response.completed", "response.incomplete"):
+            response = event.response
+        elif event.type in ("response.failed", "error"):
+            raise scheduler.StreamError(f"Stream failed: {event}", request=None, body=None)
+
+    if response is None:
+        raise scheduler.StreamError("Stream ended without a response", request=None, body=None)
+
+    latency = time.monotonic() - started
+    timing["latency"] = round(latency, 3)
+    timing["tokens_per_sec"] = round(response.usage.output_tokens / latency, 2) if latency else None
+    return response
+
+def request_params(model, layout=PROMPT_LAYOUT):
+    # requests sharing a cache key are routed to the same prompt cache
+    if layout == "prefix":
+        return {"prompt_cache_key": f"jeea25-{model}"}
+    return {}
+
+async def call_openai(prompt, model=MODEL_NAME, sample=0, timing=None, stats=None,
+                      layout=PROMPT_LAYOUT, question=None, qtype=None):
+    # Passing a timing dict streams the response and fills the dict with
+    # time-to-first-token, answer time, latency and tokens/sec. A stats dict
+    # collects request size, cache hits, retries, API latency and the usage
+    # of a response the API billed, as soon as it arrives. `question`
+    # names the question in the log ("question 3 of <run>"), so duration.py
+    # can pair the call with its answer; `qtype` is its type, for spotting
+    # the answer in the stream.
+    stats = {} if stats is None else stats
+    input = build_input(prompt, model, layout)
+    stats["bytes_sent"] = len(json.dumps(input, ensure_ascii=False).encode("utf-8"))
+    key = cache.request_key(model, input, sample)
+    if USE_CACHE:
+        response = await asyncio.to_thread(cache.get, key)
+        stats["cached"] = response is not None
+        if response is not None:
+            logger.info("Using cached response %s", key[:12])
+            return response
+
+    if question:
+        logger.info("Calling OpenAI model %s for %s", model, question)
+    else:
+        logger.info("Calling OpenAI model %s", model)
+    stream_handler = None
+    if timing is not None:
+        async def stream_handler(stream, started):
+            timing.clear()
+            return await read_stream(stream, started, timing, qtype)
+    _, async_client = openai_clients()
+    response = await scheduler.submit(async_client, model, input, stream_handler, stats,
+                                      request_params(model, layout))
+    stats["usage"] = response_usage(response)
+    if USE_CACHE:
+        await asyncio.to_thread(cache.put, key, response)
+    return response
+
+def make_result(row, response, timing=None):
+    result = {
+        "num": row["num"],
+        "subject": row["subject"],
+        "type": row["type"],
+        "ans": row["ans"],
+        "pred": extract_final_answer(response.output_text, row["type"]),
+        "response": response.output_text,
+        "usage": response_usage(response),
+    }
+    if timing:
+        result["timing"] = timing
+    return result
+
+def response_usage(response):
+    return {
+        "input_tokens": response.usage.input_tokens,
+        "cached_input_tokens": response.usage.input_tokens_details.cached_tokens,
+        "output_tokens": response.usage.output_tokens,
+        "reasoning_tokens": response.usage.output_tokens_details.reasoning_tokens,
+        "total_tokens": response.usage.total_tokens
+    }
 
-        # Save results on each call - prevents loss of info on errors
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+def question_key(row, paper, model):
+    return (paper, row["subject"], int(row["num"]), model)
+
+def journal_file(name):
+    return f"{RESULT_DIR}/{name}.jsonl"
+
+def make_run(name, paper, model, sample=0, layout=PROMPT_LAYOUT):
+    # `sample` tells repeats of the same question apart, so each repeat gets
+    # its own cache entry instead of a copy of the first answer
+    return {
+        "name": name,
+        "paper": paper,
+        "model": model,
+        "sample": sample,
+        "layout": layout,
+        "journal_file": journal_file(name),
+        "output_file": f"{RESULT_DIR}/{name}.json",
+    }
 
-        if DEBUG:
-            break
-        
-        sleep(SLEEP)
+def load_questions(paper):
+    questions = prompt_bundle()["papers"][paper]
+    if DEBUG:
+        questions = questions[:1]
+    return questions
+
+# options that change what a run asks; kept in its journal (see journal.py)
+RUN_SETTINGS = ("prompt_layout", "samples", "quorum")
+
+def run_settings(args):
+    return {name: getattr(args, name) for name in RUN_SETTINGS}
+
+def resume_settings(parser, args, path):
+    # A resumed run goes on with the settings it was started with. An option
+    # given again with another value is refused rather than mixing two
+    # configurations in one result file.
+    stored = journal.load_settings(path)
+    if stored is None:
+        return
+    for name in RUN_SETTINGS:
+        if name not in stored:
+            continue
+        value = getattr(args, name)
+        if value != parser.get_default(name) and value != stored[name]:
+            parser.error(f"--{name.replace('_', '-')} {value} differs from the "
+                         f"{stored[name]} {path} was started with")
+        setattr(args, name, stored[name])
+
+def start_run(run, settings=None):
+    if settings is not None:
+        journal.write_settings(run["journal_file"], settings)
+    if USE_LEDGER:
+        ledger.start_run(ledger_db(), run)
+
+def pending_jobs(run, questions):
+    done = journal.load(run["journal_file"])
+    return [
+        (run, idx, row) for idx, row in enumerate(questions)
+        if question_key(row, run["paper"], run["model"]) not in done
+    ]
+
+def finish_run(run, questions):
+    order = [question_key(row, run["paper"], run["model"]) for row in questions]
+    results = journal.compact(run["journal_file"], run["output_file"], order)
+    if USE_LEDGER:
+        ledger.finish_run(ledger_db(), run)
+    return results
+
+SAMPLE_FIELDS = ("pred", "response", "usage", "timing")
+
+def combine_samples(row, sample_results, cancelled=()):
+    # One record for k samples of a question: the voted prediction, the
+    # response of a sample that gave it, the summed usage, and every sample
+    # (in sample order) under "samples". Samples the quorum cancelled in
+    # flight are listed under "cancelled" as {"sample": i, "usage": ...}:
+    # their usage is added in when the response had already come back, and
+    # is None (unknown, though likely billed) when it had not.
+    preds = [r["pred"] for r in sample_results]
+    pred, support = vote.vote(row["type"], preds)
+    lead = next((r for r in sample_results if r["pred"] == pred), sample_results[0])
+    billed = [r["usage"] for r in sample_results] + [c["usage"] for c in cancelled if c["usage"]]
+    usage = {
+        field: sum(u[field] for u in billed)
+        for field in sample_results[0]["usage"]
+    }
+    record = {
+        **lead,
+        "pred": pred,
+        "usage": usage,
+        "samples": [{f: r[f] for f in SAMPLE_FIELDS if f in r} for r in sample_results],
+    }
+    if cancelled:
+        record["cancelled"] = list(cancelled)
+    return record
+
+async def solve(jobs, concurrency=CONCURRENCY, model_caps=None, stream=False,
+                run_metrics=None, samples=1, quorum=None):
+    # Jobs are (run, idx, row) triples, possibly from many runs, sharing one
+    # pool of `concurrency` request slots. A job takes its model's slot
+    # (model_caps) before a pool slot, so a capped model never holds pool
+    # slots while it waits. A question whose retries run out queues up for a
+    # slot again, so a burst of errors delays it instead of losing it. Each
+    # answer is appended to its run's journal as soon as it arrives. With
+    # `stream`, responses are streamed and each result gets a timing block.
+    # Per-request metrics go to run_metrics, if given.
+    #
+    # With samples > 1 every question is asked `samples` times and the answers
+    # are voted on (see vote.py). The first `quorum` samples go out together;
+    # the rest are only sent once those can no longer agree on their own, and
+    # whatever is still queued or in flight is cancelled as soon as `quorum`
+    # samples agree (and recorded, see combine_samples).
+    pool = asyncio.Semaphore(concurrency)
+    caps = {model: asyncio.Semaphore(cap) for model, cap in (model_caps or {}).items()}
+    quorum = min(quorum or samples // 2 + 1, samples)
+    answered = 0
+
+    async def request(run, idx, row, sample, stats=None):
+        # one request, re-queued on retryable errors; None once it gives up
+        model = run["model"]
+        cap = caps.get(model) or contextlib.nullcontext()
+        timing = {} if stream else None
+        stats = {} if stats is None else stats
+        stats.update({"queue_time": 0, "retries": 0, "sample": sample})
+        for requeues in range(scheduler.MAX_REQUEUES + 1):
+            waiting = time.monotonic()
+            try:
+                async with cap, pool:
+                    stats["queue_time"] += time.monotonic() - waiting
+                    prompt = create_prompt(row, run["layout"])
+                    response = await call_openai(prompt, model, sample, timing, stats, run["layout"],
+                                                 f"question {idx+1} of {run['name']}", row["type"])
+                break
+            except Exception as e:
+                if not scheduler.is_retryable(e) or requeues == scheduler.MAX_REQUEUES:
+                    logger.error("Giving up on question %d: %s", idx+1, e)
+                    return None
+                stats["retries"] += 1
+                logger.warning("Re-queueing question %d after error: %s", idx+1, e)
+
+        result = make_result(row, response, timing)
+        if run_metrics is not None:
+            run_metrics.record(run, row, stats, result["usage"])
+        return result
+
+    async def vote_samples(run, idx, row):
+        first = run["sample"] * samples
+        results = {}
+        sample_stats = {}
+        tasks = {}
+
+        async def sample(i):
+            result = await request(run, idx, row, first + i, sample_stats.setdefault(i, {}))
+            if result is not None:
+                results[i] = result
+
+        def launch(indices):
+            new = {asyncio.create_task(sample(i)): i for i in indices}
+            tasks.update(new)
+            return set(new)
+
+        pending = launch(range(quorum))
+        launched = quorum
+        cancelled = []
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            _, support = vote.vote(row["type"], [r["pred"] for r in results.values()])
+            if support >= quorum:
+                logger.info("Quorum of %d reached for question %d after %d sample(s)",
+                            quorum, idx+1, len(results))
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                # a cancelled sample whose response had come back was billed
+                cancelled = [{"sample": tasks[task], "usage": sample_stats.get(tasks[task], {}).get("usage")}
+                             for task in pending if tasks[task] not in results]
+                break
+            if support + len(pending) < quorum and launched < samples:
+                pending |= launch(range(launched, samples))
+                launched = samples
+
+        if not results:
+            return None
+        return combine_samples(row, [results[i] for i in sorted(results)],
+                               sorted(cancelled, key=lambda c: c["sample"]))
+
+    async def attempt(run, idx, row):
+        nonlocal answered
+        if samples > 1:
+            result = await vote_samples(run, idx, row)
+        else:
+            result = await request(run, idx, row, run["sample"])
+        if result is None:
+            return
+
+        logger.info("Got final answer %s for question %d of %s", result["pred"], idx+1, run["name"])
+
+        # the writes (journal fsync, ledger commit) run in threads, so the
+        # event loop keeps going
+        await asyncio.to_thread(journal.append, run["journal_file"],
+                                {"paper": run["paper"], "model": run["model"], **result})
+        if USE_LEDGER:
+            await asyncio.to_thread(record_answer, run, result)
+        answered += 1
+
+    await asyncio.gather(*(attempt(*job) for job in jobs))
+    return answered
+
+def batch_custom_id(row, paper):
+    return f"p{paper}-{row['subject']}-{int(row['num'])}"
+
+def solve_batch(run, jobs):
+    # The batch id is kept next to the journal until its output is merged, so
+    # --resume re-attaches to a batch that is still running instead of paying
+    # for it twice.
+    paper, model = run["paper"], run["model"]
+    batch_file = f"{RESULT_DIR}/{run['name']}_batch.jsonl"
+    id_file = f"{RESULT_DIR}/{run['name']}_batch.id"
+
+    def record(idx, row, response):
+        result = make_result(row, response)
+
+        logger.info("Got final answer %s for question %d of %s", result["pred"], idx+1, run["name"])
+
+        journal.append(run["journal_file"], {"paper": paper, "model": model, **result})
+        if USE_LEDGER:
+            ledger.record(ledger_db(), run, result)
+
+    pending = {}
+    for _, idx, row in jobs:
+        input = build_input(create_prompt(row, run["layout"]), model, run["layout"])
+        key = cache.request_key(model, input, run["sample"])
+        response = cache.get(key) if USE_CACHE else None
+        if response is not None:
+            logger.info("Using cached response %s", key[:12])
+            record(idx, row, response)
+        else:
+            pending[batch_custom_id(row, paper)] = (idx, row, key, input)
+    if not pending:
+        return
+
+    if os.path.exists(id_file):
+        with open(id_file, "r") as f:
+            batch_id = f.read().strip()
+        logger.info("Re-attaching to batch %s", batch_id)
+    else:
+        batch.write_requests(batch_file, [
+            (custom_id, {"model": model, "input": input, **request_params(model, run["layout"])})
+            for custom_id, (idx, row, key, input) in pending.items()
+        ])
+        batch_id = batch.submit(openai_clients()[0], batch_file).id
+        with open(id_file, "w") as f:
+            f.write(batch_id)
+
+    client, _ = openai_clients()
+    finished = batch.wait(client, batch_id, BATCH_POLL)
+    responses, errors = batch.read_results(client, finished)
+
+    for custom_id, response in responses.items():
+        if custom_id not in pending:
+            continue
+        idx, row, key, input = pending[custom_id]
+        if USE_CACHE:
+            cache.put(key, response)
+        record(idx, row, response)
+
+    for custom_id, error in errors.items():
+        logger.error("Batch request %s failed: %s", custom_id, error)
+
+    os.remove(id_file)
+
+def dry_run(jobs):
+    # builds every request a run would send, without sending any
+    cached = 0
+    bytes_sent = 0
+    for run, idx, row in jobs:
+        input = build_input(create_prompt(row, run["layout"]), run["model"], run["layout"])
+        bytes_sent += len(json.dumps(input, ensure_ascii=False).encode("utf-8"))
+        if USE_CACHE and os.path.exists(cache.cache_path(cache.request_key(run["model"], input, run["sample"]))):
+            cached += 1
+    logger.info("Dry run: %d request(s), %d in the response cache, %d bytes to send",
+                len(jobs), cached, bytes_sent)
 
-    logger.info(f"Saved {len(results)} result(s) to {OUTPUT_FILE}")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="RUN",
+                        help="run name (or its .jsonl journal) to continue")
+    parser.add_argument("--batch", action="store_true",
+                        help="submit the questions through the Batch API")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="max requests in flight; 1 runs questions one at a time")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream responses and record latency for each question")
+    parser.add_argument("--metrics", choices=["csv", "prom"], default="csv",
+                        help="format of the per-question metrics file")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="answers to sample per question and vote on")
+    parser.add_argument("--quorum", type=int,
+                        help="stop sampling once this many samples agree (default: a majority)")
+    parser.add_argument("--prompt-layout", choices=PROMPT_LAYOUTS, default=PROMPT_LAYOUT,
+                        help="where the instructions go; prefix lets the API cache them")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="build the run's requests and report on them without calling the API")
+    parser.add_argument("--base-url", help="send requests to this API server instead of OpenAI")
+    parser.add_argument("--mock", action="store_true",
+                        help=f"send requests to mock_server.py (at {MOCK_URL} unless --base-url is given)")
+    parser.add_argument("--optimized-images", action="store_true",
+                        help="send the images' optimized variants from images.py instead of the dataset images")
+    args = parser.parse_args()
+    if args.batch and (args.stream or args.samples > 1):
+        parser.error("--batch cannot be combined with --stream or --samples")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    use_api(args.base_url, args.mock)
+    use_optimized_images(args.optimized_images)
+
+    if args.resume:
+        name = Path(args.resume).stem
+        paper, model, sample = parse_run_name(name)
+        resume_settings(parser, args, journal_file(name))
+    else:
+        name = run_name(PAPER_NUM, MODEL_NAME)
+        paper, model, sample = PAPER_NUM, MODEL_NAME, 0
+
+    run = make_run(name, paper, model, sample, args.prompt_layout)
+    run["batch"] = args.batch
+    setup_logger(f"{LOG_DIR}/{name}.log", LOG_LEVEL)
+
+    questions = load_questions(paper)
+    jobs = pending_jobs(run, questions)
+    if args.resume:
+        logger.info("Resuming %s: %d/%d question(s) already answered",
+                    name, len(questions) - len(jobs), len(questions))
+    if args.dry_run:
+        dry_run(jobs)
+        return
+    start_run(run, run_settings(args))
+
+    if args.batch:
+        solve_batch(run, jobs)
+    else:
+        run_metrics = metrics.RunMetrics()
+        asyncio.run(solve(jobs, args.concurrency, stream=args.stream, run_metrics=run_metrics,
+                          samples=args.samples, quorum=args.quorum))
+        run_metrics.log_summary()
+        run_metrics.export(f"{RESULT_DIR}/{name}", args.metrics)
+
+    results = finish_run(run, questions)
+    if USE_CACHE:
+        cache.evict()
+
+    logger.info(f"Saved {len(results)} result(s) to {run['output_file']}")
 
 if __name__ == "__main__":
     main()
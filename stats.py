@@ -0,0 +1,118 @@
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import evaluator
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+RESAMPLES  = 100_000
+CONFIDENCE = 0.95
+SEED       = 0
+CHUNK_SIZE = 10_000  # resamples drawn at a time, bounds memory per group
+
+# -------------------------------------------------
+# Question scores
+#
+# One row per (model, paper, subject, num) with the question's type and the
+# marks scored on it. Repeated runs of a model on a paper are averaged per
+# question, so the bootstrap resamples questions, not runs.
+# -------------------------------------------------
+
+def question_scores(df):
+    return (df.groupby(['model', 'paper', 'subject', 'num', 'type'], as_index=False)['score'].mean()
+              .sort_values(['model', 'paper', 'subject', 'num'], ignore_index=True))
+
+# -------------------------------------------------
+# Bootstrap confidence intervals
+#
+# Questions are resampled with replacement within each (subject, type), so
+# every resampled paper keeps the real paper's number of questions of each
+# type per subject, and with it the paper's marking scheme and maximum
+# marks. A subject's total is the sum of its types' totals, and the paper's
+# the sum of its subjects'.
+# -------------------------------------------------
+
+def bootstrap_totals(scores, resamples, rng):
+    # (resamples,) totals of `scores` resampled with replacement
+    totals = np.empty(resamples)
+    for start in range(0, resamples, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, resamples - start)
+        idx = rng.integers(0, len(scores), size=(n, len(scores)))
+        totals[start:start + n] = scores[idx].sum(axis=1)
+    return totals
+
+def bootstrap(qs, resamples=RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    rng = np.random.default_rng(seed)
+    tail = (1 - confidence) / 2 * 100
+    rows = []
+    for (model, paper), group in qs.groupby(['model', 'paper']):
+        total = np.zeros(resamples)
+        for subject in [s for s in evaluator.SUBJECTS if s in set(group['subject'])]:
+            questions = group[group['subject'] == subject]
+            totals = np.zeros(resamples)
+            for _, stratum in questions.groupby('type'):
+                totals += bootstrap_totals(stratum['score'].to_numpy(), resamples, rng)
+            total += totals
+            lo, hi = np.percentile(totals, [tail, 100 - tail])
+            rows.append((model, paper, subject, questions['score'].sum(), totals.std(), lo, hi))
+        lo, hi = np.percentile(total, [tail, 100 - tail])
+        rows.append((model, paper, 'total', group['score'].sum(), total.std(), lo, hi))
+    return pd.DataFrame(rows, columns=['model', 'paper', 'subject', 'score', 'se', 'ci_lo', 'ci_hi'])
+
+# -------------------------------------------------
+# Paired permutation tests
+#
+# For two models on the same paper the per-question score differences are
+# paired. Under the null hypothesis that the models are interchangeable
+# each difference is equally likely to have either sign, so the p-value is
+# the share of random sign flips whose summed difference is at least as far
+# from zero as the observed one.
+# -------------------------------------------------
+
+def permutation_test(diffs, resamples, rng):
+    observed = abs(diffs.sum())
+    extreme = 0
+    for start in range(0, resamples, CHUNK_SIZE):
+        n = min(CHUNK_SIZE, resamples - start)
+        signs = rng.integers(0, 2, size=(n, len(diffs)), dtype=np.int8) * 2 - 1
+        extreme += np.count_nonzero(np.abs(signs @ diffs) >= observed - 1e-9)
+    # the observed labelling counts as one of the permutations
+    return (extreme + 1) / (resamples + 1)
+
+def compare(qs, resamples=RESAMPLES, seed=SEED):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for paper, group in qs.groupby('paper'):
+        table = group.pivot_table(index=['subject', 'num'], columns='model', values='score')
+        for a, b in itertools.combinations(sorted(table.columns), 2):
+            paired = table[[a, b]].dropna()
+            diffs = (paired[a] - paired[b]).to_numpy()
+            rows.append((paper, a, b, len(diffs), diffs.sum(), permutation_test(diffs, resamples, rng)))
+    return pd.DataFrame(rows, columns=['paper', 'model_a', 'model_b', 'questions', 'diff', 'p_value'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Confidence intervals and significance tests for run scores")
+    parser.add_argument('result_files', nargs='+')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args()
+
+    qs = question_scores(evaluator.score_table(evaluator.load_results(args.result_files)))
+
+    cis = bootstrap(qs, args.resamples, args.confidence, args.seed)
+    tests = compare(qs, args.resamples, args.seed)
+
+    with pd.option_context('display.width', 120, 'display.max_rows', None):
+        print(f"scores with {args.confidence:.0%} bootstrap CI ({args.resamples} resamples)")
+        print(cis.round(1).to_string(index=False))
+        print("")
+        print("paired permutation tests")
+        print(tests.round(4).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
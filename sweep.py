@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import itertools
+import logging
+
+import cache
+import metrics
+import solver
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+MODELS     = ["o3", "o4-mini", "gpt-4o"]
+PAPERS     = [1, 2]
+REPEATS    = 1
+WORKERS    = 16  # requests in flight across the whole sweep
+MODEL_CAPS = {
+    'o3': 8,
+}
+
+logger = logging.getLogger()
+
+# -------------------------------------------------
+# Sweep
+# -------------------------------------------------
+
+def parse_caps(values):
+    caps = dict(MODEL_CAPS)
+    for value in values or []:
+        model, _, cap = value.partition("=")
+        caps[model] = int(cap)
+    return caps
+
+def interleave(job_lists):
+    # round-robin over the runs so every cell makes progress from the start
+    # rather than one model's paper at a time
+    for jobs in itertools.zip_longest(*job_lists):
+        for job in jobs:
+            if job is not None:
+                yield job
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every model on every paper in one go")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--papers", nargs="+", type=int, default=PAPERS)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--cap", action="append", metavar="MODEL=N",
+                        help="max requests in flight for one model (repeatable)")
+    parser.add_argument("--resume", metavar="RUN_TIME",
+                        help="timestamp of an earlier sweep to continue")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream responses and record latency for each question")
+    parser.add_argument("--metrics", choices=["csv", "prom"], default="csv",
+                        help="format of the per-question metrics file")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="answers to sample per question and vote on")
+    parser.add_argument("--quorum", type=int,
+                        help="stop sampling once this many samples agree (default: a majority)")
+    parser.add_argument("--prompt-layout", choices=solver.PROMPT_LAYOUTS, default=solver.PROMPT_LAYOUT,
+                        help="where the instructions go; prefix lets the API cache them")
+    parser.add_argument("--base-url", help="send requests to this API server instead of OpenAI")
+    parser.add_argument("--mock", action="store_true",
+                        help=f"send requests to mock_server.py (at {solver.MOCK_URL} unless --base-url is given)")
+    parser.add_argument("--optimized-images", action="store_true",
+                        help="send the images' optimized variants from images.py instead of the dataset images")
+    args = parser.parse_args()
+    solver.use_api(args.base_url, args.mock)
+    solver.use_optimized_images(args.optimized_images)
+
+    run_time = args.resume or solver.RUN_TIME
+    solver.setup_logger(f"{solver.LOG_DIR}/sweep_{run_time}.log", solver.LOG_LEVEL)
+
+    questions = {paper: solver.load_questions(paper) for paper in args.papers}
+    cells = [(solver.run_name(paper, model, run_time, repeat + 1 if args.repeats > 1 else None),
+              paper, model, repeat)
+             for model, paper, repeat in itertools.product(args.models, args.papers, range(args.repeats))]
+    if args.resume:
+        # every run of a sweep is started with the same settings
+        for name, *_ in cells:
+            solver.resume_settings(parser, args, solver.journal_file(name))
+    runs = []
+    for name, paper, model, repeat in cells:
+        runs.append(solver.make_run(name, paper, model, repeat, args.prompt_layout))
+        solver.start_run(runs[-1], solver.run_settings(args))
+
+    jobs = list(interleave([solver.pending_jobs(run, questions[run["paper"]]) for run in runs]))
+    logger.info("Sweep %s: %d run(s), %d question(s) to submit", run_time, len(runs), len(jobs))
+
+    run_metrics = metrics.RunMetrics()
+    asyncio.run(solver.solve(jobs, args.workers, parse_caps(args.cap), args.stream, run_metrics,
+                             args.samples, args.quorum))
+    run_metrics.log_summary()
+    run_metrics.export(f"{solver.RESULT_DIR}/sweep_{run_time}", args.metrics)
+
+    for run in runs:
+        results = solver.finish_run(run, questions[run["paper"]])
+        logger.info(f"Saved {len(results)} result(s) to {run['output_file']}")
+
+    if solver.USE_CACHE:
+        cache.evict()
+
+if __name__ == "__main__":
+    main()
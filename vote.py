@@ -0,0 +1,61 @@
+from collections import Counter
+
+# -------------------------------------------------
+# Self-consistency voting
+#
+# Every function takes the predictions of k samples of one question (None
+# where no answer was extracted) and returns (pred, support): the
+# aggregated prediction and how many samples back it.
+# -------------------------------------------------
+
+NT_TOLERANCE = 0.01  # numeric answers this close count as the same answer
+
+def majority(preds):
+    counts = Counter(p for p in preds if p is not None)
+    if not counts:
+        return None, 0
+    # ties go to the answer seen first
+    return counts.most_common(1)[0]
+
+def vote_mca(preds):
+    # An option is picked when more than half of the answering samples pick
+    # it. If no option gets there, fall back to the most common answer.
+    valid = [p for p in preds if p is not None]
+    if not valid:
+        return None, 0
+    options = Counter(o for p in valid if p != 'O' for o in set(p.split(',')))
+    chosen = sorted(o for o, n in options.items() if n > len(valid) / 2)
+    if not chosen:
+        return majority(valid)
+    return ','.join(chosen), min(options[o] for o in chosen)
+
+def parse_number(pred):
+    try:
+        return float(pred)
+    except (TypeError, ValueError):
+        return None
+
+def vote_nt(preds, tolerance=NT_TOLERANCE):
+    # Largest cluster of values no more than `tolerance` apart; the
+    # cluster's median sample is the answer.
+    values = sorted((v, p) for p in preds if (v := parse_number(p)) is not None)
+    if not values:
+        return majority(preds)
+    best = values[:1]
+    start = 0
+    for end in range(len(values)):
+        while values[end][0] - values[start][0] > tolerance + 1e-9:
+            start += 1
+        if end - start + 1 > len(best):
+            best = values[start:end + 1]
+    return best[len(best) // 2][1], len(best)
+
+VOTE_FUNCS = {
+    'SCA': majority,
+    'M': majority,
+    'MCA': vote_mca,
+    'NT': vote_nt,
+}
+
+def vote(qtype, preds):
+    return VOTE_FUNCS[qtype](preds)